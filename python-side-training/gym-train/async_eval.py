@@ -0,0 +1,239 @@
+"""
+Evaluation of checkpoints in a separate process with its own environment. The learner only
+writes checkpoints and never waits for evaluation episodes or shares its env with them.
+"""
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+import warnings
+import zipfile
+from typing import Callable, List, Optional
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.evaluation import evaluate_policy
+
+from checkpointing import atomic_write, find_checkpoints
+
+
+class EvaluationAborted(Exception):
+    pass
+
+
+def _check_abort(abort_event: multiprocessing.Event) -> Callable:
+    def callback(locals_: dict, globals_: dict):
+        if abort_event.is_set():
+            raise EvaluationAborted()
+    return callback
+
+
+def evaluation_worker(
+    env_fn: Callable,
+    rl_algorithm: str,
+    checkpoint_dir: str,
+    name_prefix: str,
+    best_model_save_path: str,
+    log_path: str,
+    n_eval_episodes: int,
+    poll_interval: float,
+    results: multiprocessing.Queue,
+    stop_event: multiprocessing.Event,
+    abort_event: multiprocessing.Event,
+    simulator: Optional[str] = None,
+    max_load_retries: int = 3
+):
+    # Imported here, utilities imports this module
+    from utilities import prep_eval_model
+
+    os.makedirs(best_model_save_path, exist_ok=True)
+    os.makedirs(log_path, exist_ok=True)
+    env = env_fn()
+    evaluated_steps = -1
+    load_failures = 0
+    best_mean_reward = -np.inf
+    timesteps, rewards, lengths = [], [], []
+    try:
+        while not abort_event.is_set():
+            # Check stop before listing, so the newest checkpoint is still evaluated after stop
+            stopping = stop_event.is_set()
+            checkpoints = find_checkpoints(checkpoint_dir, name_prefix)
+            new_steps = [steps for steps in checkpoints if steps > evaluated_steps]
+            if not new_steps:
+                if stopping:
+                    break
+                abort_event.wait(poll_interval)
+                continue
+
+            # Evaluate only the newest checkpoint, so evaluation keeps up with training
+            steps = max(new_steps)
+            try:
+                model = prep_eval_model(rl_algorithm, checkpoints[steps])
+            except (FileNotFoundError, zipfile.BadZipFile):
+                # Checkpoint was removed by retention policy in the meantime, retry on next poll
+                load_failures += 1
+                if load_failures <= max_load_retries:
+                    time.sleep(poll_interval)
+                    continue
+                results.put({"timesteps": steps, "error": traceback.format_exc()})
+                evaluated_steps, load_failures = steps, 0
+                continue
+            except Exception:
+                # Checkpoint that cannot be loaded is skipped, the next one may be fine
+                results.put({"timesteps": steps, "error": traceback.format_exc()})
+                evaluated_steps, load_failures = steps, 0
+                continue
+            evaluated_steps, load_failures = steps, 0
+            try:
+                episode_rewards, episode_lengths = evaluate_policy(
+                    model, env, n_eval_episodes=n_eval_episodes, deterministic=True, return_episode_rewards=True,
+                    callback=_check_abort(abort_event)
+                )
+            except EvaluationAborted:
+                break
+            except Exception:
+                # Eval simulator crashed, it is relaunched and evaluation goes on with the next checkpoint
+                results.put({"timesteps": steps, "error": traceback.format_exc()})
+                try:
+                    env.close()
+                except Exception:
+                    pass
+                env = env_fn()
+                continue
+
+            timesteps.append(steps)
+            rewards.append(episode_rewards)
+            lengths.append(episode_lengths)
+            # Simulator is recorded, rewards of a stand-in simulator are not comparable with Unity ones
+            simulators = {"simulators": [simulator] * len(timesteps)} if simulator is not None else {}
+            np.savez(os.path.join(log_path, "evaluations"), timesteps=timesteps, results=rewards, ep_lengths=lengths, **simulators)
+
+            mean_reward = float(np.mean(episode_rewards))
+            is_best = mean_reward > best_mean_reward
+            if is_best:
+                best_mean_reward = mean_reward
+                # Saved from memory, retention policy may have removed the checkpoint file meanwhile
+                with atomic_write(os.path.join(best_model_save_path, "best_model.zip")) as f:
+                    model.save(f)
+            results.put({
+                "timesteps": steps,
+                "mean_reward": mean_reward,
+                "std_reward": float(np.std(episode_rewards)),
+                "mean_ep_length": float(np.mean(episode_lengths)),
+                "is_best": is_best,
+                "simulator": simulator
+            })
+    finally:
+        env.close()
+
+
+class AsyncEvalCallback(BaseCallback):
+    """
+    Starts evaluation worker process at the beginning of training and logs its results.
+    Worker picks up checkpoints written by BackgroundCheckpointCallback with the same save_path and name_prefix.
+    simulator names the env built by env_fn, it is recorded with every result in evaluations.npz.
+    """
+    def __init__(
+        self,
+        env_fn: Callable,
+        rl_algorithm: str,
+        checkpoint_dir: str,
+        name_prefix: str,
+        best_model_save_path: str,
+        log_path: str,
+        n_eval_episodes: int = 5,
+        poll_interval: float = 5.0,
+        final_eval_timeout: Optional[float] = 600.0,
+        abort_timeout: float = 60.0,
+        simulator: Optional[str] = None,
+        verbose: int = 1
+    ):
+        super().__init__(verbose)
+        self.env_fn = env_fn
+        self.rl_algorithm = rl_algorithm
+        self.checkpoint_dir = checkpoint_dir
+        self.name_prefix = name_prefix
+        self.best_model_save_path = best_model_save_path
+        self.log_path = log_path
+        self.n_eval_episodes = n_eval_episodes
+        self.poll_interval = poll_interval
+        self.final_eval_timeout = final_eval_timeout
+        self.abort_timeout = abort_timeout
+        self.simulator = simulator
+        self.process = None
+        self.evaluations = []
+        self.worker_died_reported = False
+
+    def _on_training_start(self):
+        context = multiprocessing.get_context("spawn")
+        self.results = context.Queue()
+        self.stop_event = context.Event()
+        self.abort_event = context.Event()
+        self.process = context.Process(
+            target=evaluation_worker,
+            args=(
+                self.env_fn, self.rl_algorithm, self.checkpoint_dir, self.name_prefix,
+                self.best_model_save_path, self.log_path, self.n_eval_episodes,
+                self.poll_interval, self.results, self.stop_event, self.abort_event, self.simulator
+            ),
+            daemon=True
+        )
+        self.process.start()
+
+    def _drain_results(self) -> List[dict]:
+        drained = []
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if "error" in result:
+                warnings.warn(f"Evaluation of checkpoint {result['timesteps']} steps failed:\n{result['error']}")
+                continue
+            drained.append(result)
+            self.evaluations.append(result)
+            self.logger.record("eval/mean_reward", result["mean_reward"])
+            self.logger.record("eval/mean_ep_length", result["mean_ep_length"])
+            self.logger.record("eval/checkpoint_timesteps", result["timesteps"])
+            if self.verbose > 0:
+                print(
+                    f"Eval checkpoint {result['timesteps']} steps: "
+                    f"episode_reward={result['mean_reward']:.2f} +/- {result['std_reward']:.2f}"
+                    + (" (new best)" if result["is_best"] else "")
+                )
+        return drained
+
+    def _on_step(self) -> bool:
+        self._drain_results()
+        if not self.worker_died_reported and self.n_calls % 1000 == 0 and not self.process.is_alive():
+            # Training goes on, but no more checkpoints are evaluated and best model is not updated
+            warnings.warn(f"Evaluation worker exited with code {self.process.exitcode}, checkpoints are no longer evaluated")
+            self.worker_died_reported = True
+        return True
+
+    def abort(self):
+        """
+        Skips evaluation of remaining checkpoints when training ends, the running evaluation
+        is interrupted and the worker closes its env before it exits
+        """
+        self.abort_event.set()
+
+    def _on_training_end(self):
+        # Let the worker evaluate the last checkpoint before shutting it down
+        self.stop_event.set()
+        timeout = self.abort_timeout if self.abort_event.is_set() else self.final_eval_timeout
+        start = time.time()
+        drained = []
+        # Results are drained while waiting, worker cannot exit with unread items in the queue
+        while self.process.is_alive():
+            self.process.join(self.poll_interval)
+            drained += self._drain_results()
+            if timeout is not None and time.time() - start > timeout:
+                # Last resort, env of the worker is not closed
+                warnings.warn(f"Evaluation worker did not exit in {timeout} s, terminating it")
+                self.process.terminate()
+                break
+        drained += self._drain_results()
+        if drained:
+            self.logger.dump(self.num_timesteps)
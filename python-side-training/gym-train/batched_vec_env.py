@@ -0,0 +1,31 @@
+"""
+Base of vectorized envs whose slots all live in one object, like cars of one simulated scene.
+Slots share the attributes and methods of that object, so they can be read per slot, but set
+or called only for all slots at once. Calling a method once per slot would e.g. reset the
+whole scene again for every slot.
+"""
+from typing import Any, List
+
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+
+
+class BatchedVecEnv(VecEnv):
+    def _check_all_slots(self, indices: VecEnvIndices, operation: str):
+        if sorted(self._get_indices(indices)) != list(range(self.num_envs)):
+            raise NotImplementedError(f"{type(self).__name__} slots share one scene, {operation} is supported only for all slots")
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        value = getattr(self, attr_name)
+        return [value for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None):
+        self._check_all_slots(indices, "set_attr")
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        self._check_all_slots(indices, "env_method")
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result] * self.num_envs
+
+    def env_is_wrapped(self, wrapper_class, indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
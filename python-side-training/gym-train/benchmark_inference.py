@@ -0,0 +1,91 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from inference import NumpyPolicy, export_policy
+from utilities import prep_eval_model
+
+usage_message = """
+
+- Benchmark PPO model: python3 benchmark_inference.py --rl_algorithm PPO --model logs/PPO-MlpPolicy-08-05-2023-16-51-19_best/best_model.zip
+- Benchmark with bigger micro-batches: python3 benchmark_inference.py --rl_algorithm PPO --model <model.zip> --batch_sizes 1 16 256"""
+
+parser = argparse.ArgumentParser(
+    usage=usage_message,
+    description="Compare latency and throughput of SB3 predict and exported numpy policy"
+)
+parser.add_argument(
+    "-l", "--rl_algorithm",
+    action="store",
+    choices=["PPO", "A2C", "DQN", "RecurrentPPO"],
+    required=True,
+    help="Reinforcement algorithm name"
+)
+parser.add_argument(
+    "-m", "--model",
+    action="store",
+    required=True,
+    help="Path to model"
+)
+parser.add_argument(
+    "-b", "--batch_sizes",
+    nargs="+",
+    type=int,
+    default=[1, 8, 64],
+    help="Micro-batch sizes to benchmark"
+)
+parser.add_argument(
+    "-i", "--iterations",
+    type=int,
+    default=1000,
+    help="Number of timed predictions for every batch size"
+)
+
+
+def time_predict(predict, obs: np.ndarray, iterations: int) -> np.ndarray:
+    latencies = np.empty(iterations)
+    state = None
+    episode_start = np.ones(len(obs), dtype=bool)
+    # Warm up
+    for _ in range(10):
+        predict(obs, state, episode_start)
+    for i in range(iterations):
+        start = time.perf_counter()
+        _, state = predict(obs, state, episode_start)
+        latencies[i] = time.perf_counter() - start
+        episode_start[:] = False
+    return latencies
+
+
+def main():
+    args = parser.parse_args()
+    model = prep_eval_model(args.rl_algorithm, args.model)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exported_path = os.path.join(tmp_dir, "policy.npz")
+        export_policy(model, exported_path)
+        numpy_policy = NumpyPolicy.load(exported_path)
+
+    backends = {
+        "sb3": lambda obs, state, episode_start: model.predict(obs, state=state, episode_start=episode_start, deterministic=True),
+        "numpy": lambda obs, state, episode_start: numpy_policy.predict(obs, state=state, episode_start=episode_start, deterministic=True),
+    }
+
+    rng = np.random.default_rng(0)
+    print(f"{'batch':>6} {'backend':>8} {'p50 [us]':>10} {'p99 [us]':>10} {'obs/s':>12} {'max diff':>10}")
+    for batch_size in args.batch_sizes:
+        obs = rng.uniform(0.0, 1.0, (batch_size, *model.observation_space.shape)).astype(np.float32)
+        sb3_actions, _ = backends["sb3"](obs, None, np.ones(batch_size, dtype=bool))
+        numpy_actions, _ = backends["numpy"](obs, None, np.ones(batch_size, dtype=bool))
+        max_diff = np.abs(np.asarray(sb3_actions, dtype=np.float64) - numpy_actions).max()
+        for name, predict in backends.items():
+            latencies = time_predict(predict, obs, args.iterations)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1e6
+            throughput = batch_size / latencies.mean()
+            print(f"{batch_size:>6} {name:>8} {p50:>10.1f} {p99:>10.1f} {throughput:>12.0f} {max_diff:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
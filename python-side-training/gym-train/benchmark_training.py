@@ -0,0 +1,142 @@
+import argparse
+import json
+import math
+import time
+
+from profiling import STAGES
+from utilities import *
+
+usage_message = """
+
+- Benchmark on NumPy simulator: python3 benchmark_training.py --rl_algorithms PPO A2C --num_envs 1 8 32
+- Benchmark on Unity builds and save results: python3 benchmark_training.py --env unity --exec ../environment.x86_64 --num_envs 1 4 --output bench.json
+- Compare with previous results: python3 benchmark_training.py --baseline bench.json"""
+
+parser = argparse.ArgumentParser(
+    usage=usage_message,
+    description="Training throughput benchmark, reports steps/s and time spent in every stage of the training loop"
+)
+parser.add_argument(
+    "-l", "--rl_algorithms",
+    nargs="+",
+    choices=["PPO", "A2C", "DQN", "RecurrentPPO"],
+    default=["PPO", "A2C", "RecurrentPPO"],
+    help="Reinforcement algorithms to benchmark"
+)
+parser.add_argument(
+    "-n", "--num_envs",
+    nargs="+",
+    type=int,
+    default=[1, 8],
+    help="Numbers of parallel environments to benchmark"
+)
+parser.add_argument(
+    "--env",
+    action="store",
+    choices=["unity", "sim"],
+    default="sim",
+    help="Environment backend"
+)
+parser.add_argument(
+    "-e", "--exec",
+    action="store",
+    help="Path to environment exec file, required for Unity with more than one environment"
+)
+parser.add_argument(
+    "-t", "--time_scale",
+    type=float_range(0, math.inf),
+    default=20.0,
+    help="Time scale of the Unity simulation"
+)
+parser.add_argument(
+    "-s", "--steps",
+    type=int,
+    default=20_000,
+    help="Number of env steps of every benchmark run"
+)
+parser.add_argument(
+    "-o", "--output",
+    action="store",
+    help="Path of JSON file with results"
+)
+parser.add_argument(
+    "-b", "--baseline",
+    action="store",
+    help="JSON file with previous results, runs slower by more than --tolerance are reported as regressions"
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.1,
+    help="Allowed relative throughput drop against baseline"
+)
+
+
+def run_benchmark(rl_algorithm: str, num_envs: int, args) -> dict:
+    if args.env == "sim":
+        env = prep_sim_env(num_envs)
+    elif num_envs > 1:
+        env = prep_vec_env(args.time_scale, args.exec, num_envs)
+    else:
+        env = prep_env(args.time_scale, args.exec)
+    try:
+        model = prep_train_model(rl_algorithm, env)
+        model.verbose = 0
+        model.tensorboard_log = None
+        profiling_callback = ProfilingCallback([])
+        start = time.perf_counter()
+        model.learn(total_timesteps=args.steps, callback=profiling_callback)
+        wall_time = time.perf_counter() - start
+    finally:
+        env.close()
+
+    result = {
+        "rl_algorithm": rl_algorithm,
+        "num_envs": num_envs,
+        "env": args.env,
+        "timesteps": model.num_timesteps,
+        "wall_s": wall_time,
+        "steps_per_second": model.num_timesteps / wall_time,
+    }
+    for stage in STAGES:
+        stage_total = sum(record[stage + "_total_s"] for record in profiling_callback.history)
+        result[stage + "_fraction"] = stage_total / wall_time
+    return result
+
+
+def main():
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = {(r["rl_algorithm"], r["num_envs"], r["env"]): r for r in json.load(f)}
+
+    results = []
+    regressions = []
+    print(f"{'algorithm':>12} {'envs':>5} {'steps/s':>10} {'env_step':>9} {'forward':>9} {'train':>9} {'callbacks':>9} {'vs base':>8}")
+    for rl_algorithm in args.rl_algorithms:
+        for num_envs in args.num_envs:
+            result = run_benchmark(rl_algorithm, num_envs, args)
+            results.append(result)
+            comparison = ""
+            reference = baseline.get((rl_algorithm, num_envs, args.env))
+            if reference is not None:
+                change = result["steps_per_second"] / reference["steps_per_second"] - 1.0
+                comparison = f"{change:+.1%}"
+                if change < -args.tolerance:
+                    regressions.append(result)
+            print(
+                f"{rl_algorithm:>12} {num_envs:>5} {result['steps_per_second']:>10.1f} "
+                f"{result['env_step_fraction']:>9.1%} {result['policy_forward_fraction']:>9.1%} "
+                f"{result['train_fraction']:>9.1%} {result['callbacks_fraction']:>9.1%} {comparison:>8}"
+            )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        raise SystemExit(f"Throughput regression in {len(regressions)} configuration(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Checkpointing that does not stall training. The training thread only copies parameters,
+optimizer state and algorithm attributes in memory, serialization, compression and disk
+writes are done by a background thread. Files are written under a temporary name and
+renamed when complete, so a crash never leaves a partial checkpoint behind. Old checkpoints
+are removed by a retention policy:
+
+- keep_last - newest checkpoints that are always kept
+- keep_every - of older checkpoints, the first one of every keep_every timesteps is kept
+- best checkpoint, according to evaluations of AsyncEvalCallback, is always kept
+"""
+import copy
+import glob
+import os
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Set
+
+import torch
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.save_util import recursive_getattr, save_to_zip_file
+
+CHECKPOINT_STEPS_PATTERN = re.compile(r"_(\d+)_steps\.zip$")
+TMP_SUFFIX = ".tmp"
+# Younger temporary files may belong to another run writing to the same directory
+STALE_TMP_AGE = 300.0
+
+
+def find_checkpoints(checkpoint_dir: str, name_prefix: str) -> Dict[int, str]:
+    checkpoints = {}
+    for path in glob.glob(os.path.join(checkpoint_dir, name_prefix + "_*_steps.zip")):
+        match = CHECKPOINT_STEPS_PATTERN.search(path)
+        if match is not None:
+            checkpoints[int(match.group(1))] = path
+    return checkpoints
+
+
+@contextmanager
+def atomic_write(path: str):
+    # Readers see either the previous file or the complete new one
+    tmp_path = path + TMP_SUFFIX
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def remove_stale_tmp_files(log_dir: str):
+    """
+    Removes temporary files of writes interrupted by a crash, checkpoints of any run in log_dir
+    and best models in its subdirectories, file names of previous runs have other timestamps
+    """
+    patterns = [os.path.join(log_dir, "*_steps.zip" + TMP_SUFFIX), os.path.join(log_dir, "*", "best_model.zip" + TMP_SUFFIX)]
+    now = time.time()
+    for pattern in patterns:
+        for tmp_path in glob.glob(pattern):
+            try:
+                if now - os.path.getmtime(tmp_path) > STALE_TMP_AGE:
+                    os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+
+def select_retained(steps: Iterable[int], keep_last: int, keep_every: Optional[int] = None, best_steps: Optional[int] = None) -> Set[int]:
+    steps = sorted(steps)
+    retained = set(steps[-keep_last:])
+    if best_steps is not None:
+        retained.add(best_steps)
+    if keep_every:
+        # First checkpoint of a window never changes, so thinned out history stays stable
+        windows = set()
+        for step in steps:
+            if step // keep_every not in windows:
+                windows.add(step // keep_every)
+                retained.add(step)
+    return retained
+
+
+def _clone_to_cpu(value: Any) -> Any:
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _clone_to_cpu(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_clone_to_cpu(item) for item in value)
+    return copy.deepcopy(value)
+
+
+class BackgroundCheckpointCallback(BaseCallback):
+    """
+    Drop-in replacement of CheckpointCallback, writes the same <name_prefix>_<timesteps>_steps.zip
+    files loadable by cont_train and eval. At most max_pending snapshots wait for the writer,
+    training blocks when the disk cannot keep up. keep_last=None keeps all checkpoints.
+    """
+    def __init__(
+        self,
+        save_freq: int,
+        save_path: str,
+        name_prefix: str = "rl_model",
+        keep_last: Optional[int] = None,
+        keep_every: Optional[int] = None,
+        eval_callback: Optional[BaseCallback] = None,
+        max_pending: int = 2,
+        verbose: int = 0
+    ):
+        super().__init__(verbose)
+        if keep_last is not None and keep_last < 1:
+            raise ValueError("keep_last must be at least 1, evaluation uses the newest checkpoint")
+        self.save_freq = save_freq
+        self.save_path = save_path
+        self.name_prefix = name_prefix
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.eval_callback = eval_callback
+        self.max_pending = max_pending
+        self.best_steps = None
+        self.error = None
+        self.thread = None
+
+    def _on_training_start(self):
+        os.makedirs(self.save_path, exist_ok=True)
+        remove_stale_tmp_files(self.save_path)
+        self.pending = queue.Queue(maxsize=self.max_pending)
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def _checkpoint_path(self) -> str:
+        return os.path.join(self.save_path, f"{self.name_prefix}_{self.num_timesteps}_steps.zip")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # Same content as BaseAlgorithm.save, copied so the training thread can go on
+        data = self.model.__dict__.copy()
+        exclude = set(self.model._excluded_save_params())
+        state_dicts_names, torch_variable_names = self.model._get_torch_save_params()
+        for name in state_dicts_names + torch_variable_names:
+            exclude.add(name.split(".")[0])
+        for name in exclude:
+            data.pop(name, None)
+        pytorch_variables = {name: _clone_to_cpu(recursive_getattr(self.model, name)) for name in torch_variable_names}
+        return {
+            "path": self._checkpoint_path(),
+            "data": copy.deepcopy(data),
+            "params": _clone_to_cpu(self.model.get_parameters()),
+            "pytorch_variables": pytorch_variables
+        }
+
+    def _writer(self):
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                break
+            try:
+                with atomic_write(snapshot["path"]) as f:
+                    save_to_zip_file(f, data=snapshot["data"], params=snapshot["params"], pytorch_variables=snapshot["pytorch_variables"])
+                if self.verbose >= 2:
+                    print(f"Saving model checkpoint to {snapshot['path']}")
+                self._apply_retention()
+            except Exception as error:
+                self.error = error
+
+    def _apply_retention(self):
+        if self.keep_last is None:
+            return
+        checkpoints = find_checkpoints(self.save_path, self.name_prefix)
+        retained = select_retained(checkpoints, self.keep_last, self.keep_every, self.best_steps)
+        for steps, path in checkpoints.items():
+            if steps not in retained:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _raise_writer_error(self):
+        if self.error is not None:
+            raise RuntimeError("Writing checkpoint failed") from self.error
+
+    def _on_step(self) -> bool:
+        self._raise_writer_error()
+        if self.n_calls % self.save_freq == 0:
+            evaluations = getattr(self.eval_callback, "evaluations", None)
+            if evaluations:
+                self.best_steps = max(evaluations, key=lambda result: result["mean_reward"])["timesteps"]
+            self.pending.put(self._snapshot())
+        return True
+
+    def _on_training_end(self):
+        # Pending checkpoints are written before evaluation of the last one and before exit
+        self.pending.put(None)
+        self.thread.join()
+        self._raise_writer_error()
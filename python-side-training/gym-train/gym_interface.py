@@ -1,5 +1,6 @@
 import math
 import argparse
+import os
 
 from stable_baselines3.common.utils import set_random_seed
 import numpy as np
@@ -10,7 +11,13 @@ from utilities import *
 usage_message ="""
 
 - Evaluate trained PPO model: python3 gym_interface.py --action eval --rl_algorithm PPO --model logs/PPO-MlpPolicy-08-05-2023-16-51-19_best/best_model.zip
+- Evaluate exported numpy policy: python3 gym_interface.py --action eval --rl_algorithm PPO --model logs/PPO-MlpPolicy-08-05-2023-16-51-19_best/best_model.npz
+- Export trained model to torch-free numpy policy: python3 gym_interface.py --action export --rl_algorithm PPO --model logs/PPO-MlpPolicy-08-05-2023-16-51-19_best/best_model.zip
 - Train a new model: python3 gym_interface.py --action train --rl_algorithm PPO
+- Train a new model on 8 parallel simulators: python3 gym_interface.py --action train --rl_algorithm PPO --exec ../environment.x86_64 --num_envs 8
+- Train a new model on all cars of a multi-car scene in one Unity process: python3 gym_interface.py --action train --rl_algorithm PPO --env unity_multi --exec ../environment.x86_64
+- Pretrain a new model without Unity on 64 simulated cars: python3 gym_interface.py --action train --rl_algorithm PPO --env sim --num_envs 64
+- Evaluate trained model and record the drive: python3 gym_interface.py --action eval --rl_algorithm PPO --model <model.zip> --record recordings/ppo_eval
 - Continue training of an existing model: python3 gym_interface.py --action cont_train --rl_algorithm PPO --model logs/PPO-MlpPolicy-08-05-2023-16-51-19_best/best_model.zip
 - In separate terminal run: tensorboard --logdir <tensorboard log directory> to open tensorboard dashboard
 If --exec argument is not provided, You need to have Unity Editor open with the environment prepared and after launching this script, launch the simulation in Unity"""
@@ -22,9 +29,16 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "-a", "--action",
     action="store",
-    choices=["train", "cont_train", "eval"],
+    choices=["train", "cont_train", "eval", "export"],
     required=True,
-    help="Choose whether train a new model, continue training from existing model or evaluate trained model"
+    help="Choose whether train a new model, continue training from existing model, evaluate trained model or export it for numpy inference"
+)
+parser.add_argument(
+    "--env",
+    action="store",
+    choices=["unity", "unity_multi", "sim"],
+    default="unity",
+    help="Environment backend, Unity simulation, Unity scene with many cars driven as one vectorized env (number of envs is the number of cars in the scene) or headless NumPy race track simulator with the same observation and action spaces"
 )
 parser.add_argument(
     "-e", "--exec",
@@ -56,44 +70,130 @@ parser.add_argument(
     type=int,
     help="Number of steps to train the agent"
 )
+parser.add_argument(
+    "-n", "--num_envs",
+    action="store",
+    default=1,
+    type=int,
+    help="Number of parallel environments used for training, for Unity values above 1 require --exec"
+)
+parser.add_argument(
+    "-r", "--record",
+    action="store",
+    help="Directory to which observations, actions and rewards are appended, load them with rollout_recorder.RolloutDataset"
+)
+parser.add_argument(
+    "--keep_last",
+    action="store",
+    default=5,
+    type=int,
+    help="Number of newest checkpoints kept in logs/, 0 keeps all checkpoints"
+)
+parser.add_argument(
+    "--keep_every",
+    action="store",
+    default=100_000,
+    type=int,
+    help="Of checkpoints older than --keep_last, the first one of every this many steps is kept, 0 removes all of them except the best one"
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Time env steps, policy forward passes, updates and callbacks, results go to tensorboard (timing/) and logs/<tb log name>_timing.jsonl"
+)
+parser.add_argument(
+    "-p", "--obs_pipeline",
+    action="store",
+    help="Observation preprocessing, e.g. minpool:128,clip:0:1,float16,stack:4, see obs_preprocessing.py. Saved with the model and reused by cont_train, eval and export"
+)
 
 
 def main():
     set_random_seed(0)
     # Parse arguments
     args = parser.parse_args()
-    if (args.action == "cont_train" or args.action =="eval") and args.model is None:
-        raise argparse.ArgumentTypeError("When selecting action cont_train or eval, You must provide path to model")
+    if args.action in ("cont_train", "eval", "export") and args.model is None:
+        raise argparse.ArgumentTypeError("When selecting action cont_train, eval or export, You must provide path to model")
+    if args.num_envs < 1:
+        raise argparse.ArgumentTypeError("Number of environments must be greater than 0")
+    if args.keep_last < 0 or args.keep_every < 0:
+        raise argparse.ArgumentTypeError("Checkpoint retention values must not be negative")
 
-    # Environment initialization
-    env = prep_env(args.time_scale, args.exec)
-    model = prep_model(args.rl_algorithm, args.action, env, args.model)
+    # Existing model must be used with the preprocessing it was trained with
+    obs_pipeline = args.obs_pipeline
+    if args.model is not None:
+        saved_obs_pipeline = find_pipeline_spec(args.model)
+        if saved_obs_pipeline is not None:
+            if obs_pipeline is not None and obs_pipeline != saved_obs_pipeline:
+                raise argparse.ArgumentTypeError(f"Model was trained with observation pipeline {saved_obs_pipeline}")
+            obs_pipeline = saved_obs_pipeline
+
+    # Export does not need an environment
+    if args.action == "export":
+        model = prep_model(args.rl_algorithm, args.action, None, args.model)
+        export_policy(model, os.path.splitext(args.model)[0] + ".npz", obs_pipeline)
+        return
 
-    # Train
-    if args.action == "train" or args.action == "cont_train":
-        filename_best, filename_checkpoint, tb_log_filename = prep_logfile_names(args.rl_algorithm)
-        eval_callback, checkpoint_callback = prep_callbacks(env, filename_best, filename_checkpoint)
-        model.learn(total_timesteps=args.steps, callback=[eval_callback, checkpoint_callback], progress_bar=True, tb_log_name=tb_log_filename)
+    # Exported numpy policy applies preprocessing to raw observations itself
+    if args.model is not None and args.model.endswith(".npz"):
+        env_obs_pipeline = None
+    else:
+        env_obs_pipeline = obs_pipeline
 
-    # Evaluation
+    # Environment initialization, evaluation runs on a single environment, multi-car scene is used as a whole
+    if args.env == "sim":
+        env = prep_sim_env(args.num_envs if args.action != "eval" else 1, obs_pipeline=env_obs_pipeline)
+    elif args.env == "unity_multi":
+        env = prep_multi_agent_env(args.time_scale, args.exec, obs_pipeline=env_obs_pipeline)
+    elif args.num_envs > 1 and args.action != "eval":
+        env = prep_vec_env(args.time_scale, args.exec, args.num_envs, obs_pipeline=env_obs_pipeline)
     else:
-        # In unity env observation is already normalized
-        obs, reward, done, info = env.step(env.action_space.sample())
-        lstm_states = None
-        episode_start = True
-        for i in range(10_000):
-            if done:
-                env.reset()
-                break
-            action, lstm_states = model.predict(
-                obs,
-                state=lstm_states,
-                episode_start=episode_start,
-                deterministic=True
+        env = prep_env(args.time_scale, args.exec, obs_pipeline=env_obs_pipeline)
+    env = wrap_recorder(env, args.record)
+    model = prep_model(args.rl_algorithm, args.action, env, args.model)
+
+    try:
+        # Train
+        if args.action == "train" or args.action == "cont_train":
+            filename_best, filename_checkpoint, tb_log_filename = prep_logfile_names(args.rl_algorithm)
+            save_obs_pipeline(obs_pipeline, filename_best, filename_checkpoint)
+            num_envs = env.num_envs if isinstance(env, VecEnv) else 1
+            eval_env_fn, eval_simulator = prep_eval_env_fn(args.env, args.time_scale, args.exec, num_envs, obs_pipeline)
+            eval_callback, checkpoint_callback = prep_callbacks(
+                eval_env_fn, args.rl_algorithm, filename_best, filename_checkpoint, num_envs,
+                keep_last=args.keep_last or None, keep_every=args.keep_every or None, eval_simulator=eval_simulator
             )
-            obs, reward, done, info = env.step(action)
-            episode_start = False
+            callbacks = [checkpoint_callback, eval_callback]
+            if args.profile:
+                callbacks = [ProfilingCallback(callbacks, os.path.join("logs", tb_log_filename + "_timing.jsonl"))]
+            model.learn(total_timesteps=args.steps, callback=callbacks, progress_bar=True, tb_log_name=tb_log_filename)
+
+        # Evaluation
+        else:
+            # In unity env observation is already normalized
+            obs = env.reset()
+            done = False
+            lstm_states = None
+            # Multi-car scene is evaluated until the first car ends its episode
+            episode_start = np.ones(env.num_envs, dtype=bool) if isinstance(env, VecEnv) else True
+            for i in range(10_000):
+                if np.any(done):
+                    env.reset()
+                    break
+                action, lstm_states = model.predict(
+                    obs,
+                    state=lstm_states,
+                    episode_start=episode_start,
+                    deterministic=True
+                )
+                obs, reward, done, info = env.step(action)
+                episode_start = done
+
+    # Simulator processes are shut down also when training is interrupted
+    finally:
+        env.close()
 
-    env.close()
 
-main()
+# Guard is required, simulator worker processes re-import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Torch-free inference of trained SB3 policies. Policy weights are exported once to a plain
+NumPy .npz archive and evaluated with NumPy only, so the runtime does not need torch,
+stable-baselines3 or the full model zip with optimizer state.
+"""
+import json
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from obs_transforms import ObservationPipeline
+
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+    "Sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "Identity": lambda x: x,
+}
+
+
+def _export_sequential(sequential, prefix: str, arrays: Dict[str, np.ndarray]) -> List[dict]:
+    layers = []
+    for i, module in enumerate(sequential):
+        module_type = type(module).__name__
+        if module_type == "Linear":
+            name = f"{prefix}_{i}"
+            # Stored transposed, so forward pass is x @ W + b
+            arrays[name + ".weight"] = module.weight.detach().cpu().numpy().T.astype(np.float32)
+            arrays[name + ".bias"] = module.bias.detach().cpu().numpy().astype(np.float32)
+            layers.append({"type": "linear", "name": name})
+        elif module_type in ACTIVATIONS:
+            layers.append({"type": module_type})
+        else:
+            raise ValueError(f"Layer {module_type} is not supported by numpy inference")
+    return layers
+
+
+def export_policy(model, path: str, obs_pipeline: Optional[str] = None):
+    """
+    Export policy of PPO, A2C, RecurrentPPO or DQN model to .npz file used by NumpyPolicy.
+    Observation preprocessing spec is stored with the weights, NumpyPolicy applies it to raw observations.
+    """
+    arrays = {}
+    spec = {"algorithm": type(model).__name__, "lstm": None, "discrete": False, "obs_pipeline": obs_pipeline}
+    policy = model.policy
+    if spec["algorithm"] == "DQN":
+        spec["layers"] = _export_sequential(policy.q_net.q_net, "q", arrays)
+        spec["discrete"] = True
+    else:
+        layers = []
+        if policy.features_extractor.__class__.__name__ != "FlattenExtractor":
+            raise ValueError("Only flattened vector observations are supported by numpy inference")
+        if spec["algorithm"] == "RecurrentPPO":
+            lstm = policy.lstm_actor
+            spec["lstm"] = {"num_layers": lstm.num_layers, "hidden_size": lstm.hidden_size}
+            for layer in range(lstm.num_layers):
+                arrays[f"lstm_{layer}.weight_ih"] = getattr(lstm, f"weight_ih_l{layer}").detach().cpu().numpy().T.astype(np.float32)
+                arrays[f"lstm_{layer}.weight_hh"] = getattr(lstm, f"weight_hh_l{layer}").detach().cpu().numpy().T.astype(np.float32)
+                arrays[f"lstm_{layer}.bias"] = (
+                    getattr(lstm, f"bias_ih_l{layer}") + getattr(lstm, f"bias_hh_l{layer}")
+                ).detach().cpu().numpy().astype(np.float32)
+        # Older SB3 versions have layers shared between actor and critic
+        shared_net = getattr(policy.mlp_extractor, "shared_net", None)
+        if shared_net is not None:
+            layers += _export_sequential(shared_net, "shared", arrays)
+        layers += _export_sequential(policy.mlp_extractor.policy_net, "pi", arrays)
+        layers += _export_sequential([policy.action_net], "action", arrays)
+        spec["layers"] = layers
+        if policy.squash_output:
+            spec["layers"].append({"type": "Tanh"})
+        spec["action_low"] = model.action_space.low.tolist()
+        spec["action_high"] = model.action_space.high.tolist()
+    spec["observation_shape"] = list(model.observation_space.shape)
+    np.savez(path, spec=np.array(json.dumps(spec)), **arrays)
+
+
+class NumpyPolicy:
+    """
+    Deterministic policy evaluated with NumPy. predict has the same signature as SB3 model.predict,
+    accepts single raw observation or micro-batch and keeps LSTM state for RecurrentPPO.
+    With frame stacking in the preprocessing pipeline, state is a (lstm state, frame history) tuple.
+    """
+    def __init__(self, spec: dict, arrays: Dict[str, np.ndarray]):
+        self.spec = spec
+        self.observation_size = int(np.prod(spec["observation_shape"]))
+        self.discrete = spec["discrete"]
+        self.pipeline = ObservationPipeline(spec["obs_pipeline"]) if spec.get("obs_pipeline") else None
+        self.lstm = spec["lstm"]
+        self.lstm_weights = []
+        if self.lstm is not None:
+            for layer in range(self.lstm["num_layers"]):
+                self.lstm_weights.append((
+                    arrays[f"lstm_{layer}.weight_ih"], arrays[f"lstm_{layer}.weight_hh"], arrays[f"lstm_{layer}.bias"]
+                ))
+        self.layers = []
+        for layer in spec["layers"]:
+            if layer["type"] == "linear":
+                self.layers.append((arrays[layer["name"] + ".weight"], arrays[layer["name"] + ".bias"]))
+            else:
+                self.layers.append(ACTIVATIONS[layer["type"]])
+        if not self.discrete:
+            self.action_low = np.array(spec["action_low"], dtype=np.float32)
+            self.action_high = np.array(spec["action_high"], dtype=np.float32)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyPolicy":
+        with np.load(path) as archive:
+            spec = json.loads(str(archive["spec"]))
+            arrays = {key: np.ascontiguousarray(archive[key]) for key in archive.files if key != "spec"}
+        return cls(spec, arrays)
+
+    def initial_state(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        shape = (self.lstm["num_layers"], batch_size, self.lstm["hidden_size"])
+        return np.zeros(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32)
+
+    def _lstm_step(self, x: np.ndarray, state: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        hidden, cell = state
+        new_hidden, new_cell = np.empty_like(hidden), np.empty_like(cell)
+        size = self.lstm["hidden_size"]
+        for layer, (weight_ih, weight_hh, bias) in enumerate(self.lstm_weights):
+            # Gates in PyTorch order: input, forget, cell, output
+            gates = x @ weight_ih + hidden[layer] @ weight_hh + bias
+            i = 1.0 / (1.0 + np.exp(-gates[:, :size]))
+            f = 1.0 / (1.0 + np.exp(-gates[:, size:2 * size]))
+            g = np.tanh(gates[:, 2 * size:3 * size])
+            o = 1.0 / (1.0 + np.exp(-gates[:, 3 * size:]))
+            new_cell[layer] = f * cell[layer] + i * g
+            new_hidden[layer] = o * np.tanh(new_cell[layer])
+            x = new_hidden[layer]
+        return x, (new_hidden, new_cell)
+
+    def _stack_frames(self, frames: np.ndarray, history: Optional[np.ndarray], episode_start) -> Tuple[np.ndarray, np.ndarray]:
+        stacker = self.pipeline.make_stacker(len(frames), frames.shape[-1], frames.dtype)
+        if history is None:
+            return stacker.reset(frames), stacker.frames
+        stacker.frames[:] = history
+        obs = stacker.push(frames)
+        if episode_start is not None:
+            # History of environments that start a new episode is filled with the first frame
+            starts = np.flatnonzero(np.broadcast_to(np.asarray(episode_start, dtype=bool).reshape(-1), (len(frames),)))
+            if len(starts) > 0:
+                obs[starts] = stacker.reset(frames[starts], starts)
+        return obs, stacker.frames
+
+    def forward(self, obs: np.ndarray) -> np.ndarray:
+        x = obs
+        for layer in self.layers:
+            if isinstance(layer, tuple):
+                x = x @ layer[0] + layer[1]
+            else:
+                x = layer(x)
+        return x
+
+    def predict(
+        self,
+        observation: np.ndarray,
+        state: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        episode_start: Optional[Union[bool, np.ndarray]] = None,
+        deterministic: bool = True
+    ) -> Tuple[np.ndarray, Optional[Tuple[np.ndarray, np.ndarray]]]:
+        # Only deterministic actions are supported, argument kept for compatibility with SB3
+        obs = np.asarray(observation, dtype=np.float32)
+        single = obs.ndim == len(self.spec["observation_shape"])
+        stacking = self.pipeline is not None and self.pipeline.stack > 1
+        history = None
+        if stacking and state is not None:
+            state, history = state
+        if self.pipeline is not None:
+            obs = self.pipeline.transform(obs.reshape(-1, obs.shape[-1]))
+            if stacking:
+                obs, history = self._stack_frames(obs, history, episode_start)
+        obs = obs.reshape(-1, self.observation_size).astype(np.float32)
+
+        if self.lstm is not None:
+            if state is None:
+                state = self.initial_state(len(obs))
+            if episode_start is not None:
+                # Reset memory of environments that start a new episode
+                keep = 1.0 - np.asarray(episode_start, dtype=np.float32).reshape(1, -1, 1)
+                state = (state[0] * keep, state[1] * keep)
+            obs, state = self._lstm_step(obs, state)
+
+        out = self.forward(obs)
+        if self.discrete:
+            actions = out.argmax(axis=1)
+        else:
+            actions = np.clip(out, self.action_low, self.action_high)
+        if single:
+            actions = actions[0]
+        if stacking:
+            return actions, (state, history)
+        return actions, state
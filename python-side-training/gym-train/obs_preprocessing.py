@@ -0,0 +1,97 @@
+"""
+Configurable preprocessing of lidar observations. Pipeline is described by a spec string,
+for example "minpool:128,clip:0:1,quantize:256,float16,stack:4", applied in the given order:
+
+- minpool:N - split rays into N sectors and keep the closest distance of every sector
+- subsample:N - keep N evenly spaced rays
+- clip:LOW:HIGH - clip distances to [LOW, HIGH]
+- quantize:LEVELS - round distances to LEVELS evenly spaced values, requires bounded values (clip)
+- float16 - store observations as float16, halves observations sent between processes and DQN
+  replay buffers, rollout buffers of PPO and A2C stay float32 in SB3
+- stack:K - concatenate K most recent observations for velocity cues, must be the last step
+
+Spec is saved next to the model and in exported policies, so eval and inference apply exactly
+the same transform, NumpyPolicy applies it to raw observations itself.
+"""
+import json
+import os
+from typing import Optional
+
+import gym
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv, VecEnvWrapper
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+from obs_transforms import ObservationPipeline
+
+PREPROCESSING_FILENAME = "preprocessing.json"
+
+
+class PreprocessObservation(gym.Wrapper):
+    def __init__(self, env: gym.Env, pipeline: ObservationPipeline):
+        super().__init__(env)
+        self.pipeline = pipeline
+        self.observation_space = pipeline.observation_space(env.observation_space)
+        frame_size = self.observation_space.shape[0] // pipeline.stack
+        self.stacker = pipeline.make_stacker(1, frame_size, self.observation_space.dtype)
+
+    def reset(self, **kwargs):
+        obs = self.pipeline.transform(self.env.reset(**kwargs))
+        return self.stacker.reset(obs[None])[0]
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        return self.stacker.push(self.pipeline.transform(obs)[None])[0], reward, done, info
+
+
+class VecPreprocessObservation(VecEnvWrapper):
+    def __init__(self, venv: VecEnv, pipeline: ObservationPipeline):
+        self.pipeline = pipeline
+        observation_space = pipeline.observation_space(venv.observation_space)
+        super().__init__(venv, observation_space=observation_space)
+        frame_size = observation_space.shape[0] // pipeline.stack
+        self.stacker = pipeline.make_stacker(venv.num_envs, frame_size, observation_space.dtype)
+
+    def reset(self) -> VecEnvObs:
+        return self.stacker.reset(self.pipeline.transform(self.venv.reset()))
+
+    def step_wait(self) -> VecEnvStepReturn:
+        obs, rewards, dones, infos = self.venv.step_wait()
+        obs = self.stacker.push(self.pipeline.transform(obs))
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx) > 0:
+            # Observation of a done env is already the first one of the next episode
+            for i in done_idx:
+                terminal_obs = self.pipeline.transform(infos[i]["terminal_observation"])
+                infos[i]["terminal_observation"] = np.concatenate([obs[i, :-terminal_obs.shape[0]], terminal_obs])
+            obs[done_idx] = self.stacker.reset(obs[done_idx, -self.stacker.frames.shape[-1]:], done_idx)
+        return obs, rewards, dones, infos
+
+
+def wrap_env(env, spec: Optional[str]):
+    if not spec:
+        return env
+    pipeline = ObservationPipeline(spec)
+    if isinstance(env, VecEnv):
+        return VecPreprocessObservation(env, pipeline)
+    return PreprocessObservation(env, pipeline)
+
+
+def find_pipeline_spec(model_path: str) -> Optional[str]:
+    """
+    Returns spec saved with the model, checks exported policy, best model directory and checkpoint prefix
+    """
+    if model_path.endswith(".npz"):
+        with np.load(model_path) as archive:
+            spec = json.loads(str(archive["spec"])).get("obs_pipeline")
+        if spec is not None:
+            return spec
+    directory, filename = os.path.split(model_path)
+    candidates = [os.path.join(directory, PREPROCESSING_FILENAME)]
+    if "_steps" in filename:
+        prefix = filename[:filename.rindex("_", 0, filename.rindex("_steps"))]
+        candidates.insert(0, os.path.join(directory, prefix + "_" + PREPROCESSING_FILENAME))
+    for path in candidates:
+        if os.path.exists(path):
+            return ObservationPipeline.load(path).spec
+    return None
@@ -0,0 +1,121 @@
+"""
+Observation transforms of the preprocessing pipeline, NumPy only, so they are shared by
+the env wrappers in obs_preprocessing.py and by torch-free inference.
+"""
+import json
+import os
+from typing import Optional
+
+import numpy as np
+
+
+class ObservationPipeline:
+    """
+    Stateless part of the pipeline works on any leading batch dimensions, frame stacking
+    is done by FrameStacker, which keeps the history of every environment.
+    """
+    def __init__(self, spec: str):
+        self.spec = spec
+        self.steps = []
+        self.stack = 1
+        for step in filter(None, (part.strip() for part in spec.split(","))):
+            name, *params = step.split(":")
+            if self.stack > 1:
+                raise ValueError("Frame stacking must be the last preprocessing step")
+            if name in ("minpool", "subsample", "quantize", "stack"):
+                if len(params) != 1 or int(params[0]) < (2 if name == "quantize" else 1):
+                    raise ValueError(f"Preprocessing step {name} requires one positive integer parameter, quantize at least 2 levels")
+                if name == "stack":
+                    self.stack = int(params[0])
+                elif name == "quantize" and not any(step_name == "clip" for step_name, _ in self.steps):
+                    raise ValueError("Quantization requires bounded observations, add clip step before it")
+                else:
+                    self.steps.append((name, int(params[0])))
+            elif name == "clip":
+                if len(params) != 2 or float(params[0]) >= float(params[1]):
+                    raise ValueError("Preprocessing step clip requires LOW:HIGH parameters with LOW < HIGH")
+                self.steps.append((name, (float(params[0]), float(params[1]))))
+            elif name == "float16":
+                self.steps.append((name, None))
+            else:
+                raise ValueError(f"Unknown preprocessing step {name}")
+
+    def observation_space(self, space):
+        # Imported here, numpy inference does not need gym
+        from gym import spaces
+        low, high, dtype = space.low.astype(np.float64), space.high.astype(np.float64), space.dtype
+        for name, param in self.steps:
+            if name == "minpool":
+                low, high = self._minpool(low, param), self._minpool(high, param)
+            elif name == "subsample":
+                low, high = self._subsample(low, param), self._subsample(high, param)
+            elif name == "clip":
+                low, high = np.clip(low, *param), np.clip(high, *param)
+            elif name == "float16":
+                dtype = np.float16
+        low, high = np.tile(low, self.stack), np.tile(high, self.stack)
+        return spaces.Box(low.astype(dtype), high.astype(dtype), dtype=dtype)
+
+    def transform(self, obs: np.ndarray) -> np.ndarray:
+        obs = np.asarray(obs, dtype=np.float32)
+        low, high = None, None
+        for name, param in self.steps:
+            if name == "minpool":
+                obs = self._minpool(obs, param)
+            elif name == "subsample":
+                obs = self._subsample(obs, param)
+            elif name == "clip":
+                low, high = param
+                obs = np.clip(obs, low, high)
+            elif name == "quantize":
+                step = (high - low) / (param - 1)
+                obs = np.round((obs - low) / step) * step + low
+            elif name == "float16":
+                obs = obs.astype(np.float16)
+        return obs
+
+    def make_stacker(self, num_envs: int, frame_size: int, dtype) -> "FrameStacker":
+        return FrameStacker(num_envs, self.stack, frame_size, dtype)
+
+    @staticmethod
+    def _check_size(name: str, size: int, obs: np.ndarray):
+        if size > obs.shape[-1]:
+            raise ValueError(f"Preprocessing step {name}:{size} exceeds {obs.shape[-1]} observation values")
+
+    @staticmethod
+    def _minpool(obs: np.ndarray, sectors: int) -> np.ndarray:
+        ObservationPipeline._check_size("minpool", sectors, obs)
+        bounds = np.linspace(0, obs.shape[-1], sectors + 1).astype(np.int64)[:-1]
+        return np.minimum.reduceat(obs, bounds, axis=-1)
+
+    @staticmethod
+    def _subsample(obs: np.ndarray, rays: int) -> np.ndarray:
+        ObservationPipeline._check_size("subsample", rays, obs)
+        return obs[..., np.linspace(0, obs.shape[-1] - 1, rays).round().astype(np.int64)]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"spec": self.spec}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "ObservationPipeline":
+        with open(path) as f:
+            return cls(json.load(f)["spec"])
+
+
+class FrameStacker:
+    def __init__(self, num_envs: int, stack: int, frame_size: int, dtype):
+        self.stack = stack
+        self.frames = np.zeros((num_envs, stack, frame_size), dtype=dtype)
+
+    def reset(self, frames: np.ndarray, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        indices = slice(None) if indices is None else indices
+        # Fill history with the first frame of an episode
+        self.frames[indices] = frames[:, None, :]
+        return self.frames[indices].reshape(len(frames), -1).copy()
+
+    def push(self, frames: np.ndarray) -> np.ndarray:
+        self.frames[:, :-1] = self.frames[:, 1:]
+        self.frames[:, -1] = frames
+        return self.frames.reshape(len(frames), -1).copy()
@@ -0,0 +1,163 @@
+"""
+Per-stage timing of the training loop. ProfilingCallback measures:
+
+- env_step - round trip of a vectorized env step, communication with the simulator included
+- policy_forward - policy forward pass used to pick actions while collecting rollouts
+- train - gradient updates, measured as time between the end of a rollout and the start of the next one
+- callbacks - other callbacks, in-memory checkpoint snapshots included
+
+Statistics are recorded with the model logger (tensorboard, under timing/) after every rollout
+and appended as JSON lines to a file.
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback, CallbackList
+from stable_baselines3.common.vec_env import VecEnv, VecEnvWrapper
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+STAGES = ("env_step", "policy_forward", "train", "callbacks")
+
+
+class StageTimer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.depth = defaultdict(int)
+
+    @contextmanager
+    def time(self, stage: str):
+        # Nested calls of the same stage are counted once
+        self.depth[stage] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[stage] -= 1
+            if self.depth[stage] == 0:
+                self.totals[stage] += time.perf_counter() - start
+                self.counts[stage] += 1
+
+    def add(self, stage: str, seconds: float):
+        self.totals[stage] += seconds
+        self.counts[stage] += 1
+
+    def pop(self) -> Dict[str, Dict[str, float]]:
+        stats = {stage: {"total_s": self.totals[stage], "calls": self.counts[stage]} for stage in STAGES}
+        self.totals.clear()
+        self.counts.clear()
+        return stats
+
+
+class TimedVecEnv(VecEnvWrapper):
+    def __init__(self, venv: VecEnv, timer: StageTimer):
+        super().__init__(venv)
+        self.timer = timer
+        self.step_start = 0.0
+
+    def reset(self) -> VecEnvObs:
+        return self.venv.reset()
+
+    def step_async(self, actions: np.ndarray):
+        self.step_start = time.perf_counter()
+        self.venv.step_async(actions)
+
+    def step_wait(self) -> VecEnvStepReturn:
+        result = self.venv.step_wait()
+        self.timer.add("env_step", time.perf_counter() - self.step_start)
+        return result
+
+
+def _timed_method(obj, name: str, timer: StageTimer, stage: str):
+    method = getattr(obj, name)
+
+    def timed(*args, **kwargs):
+        with timer.time(stage):
+            return method(*args, **kwargs)
+    # Instance attribute shadows the method, removed again by _restore_method
+    setattr(obj, name, timed)
+
+
+def _restore_method(obj, name: str):
+    if name in vars(obj):
+        delattr(obj, name)
+
+
+class ProfilingCallback(CallbackList):
+    """
+    Wraps the other callbacks to time them and instruments policy and env for the duration of training
+    """
+    def __init__(self, callbacks: List[BaseCallback], output_path: Optional[str] = None, verbose: int = 0):
+        super().__init__(callbacks)
+        self.verbose = verbose
+        self.output_path = output_path
+        self.timer = StageTimer()
+        self.history = []
+
+    def _on_training_start(self):
+        # Policy forward covers rollout collection of all algorithms, _predict is used by DQN.
+        # Model itself is not instrumented, it is pickled into checkpoints during training
+        _timed_method(self.model.policy, "forward", self.timer, "policy_forward")
+        _timed_method(self.model.policy, "_predict", self.timer, "policy_forward")
+        self.rollout_end_time = None
+        self.model.env = TimedVecEnv(self.model.env, self.timer)
+        if self.output_path is not None:
+            os.makedirs(os.path.dirname(self.output_path) or ".", exist_ok=True)
+        self.last_report_time = time.perf_counter()
+        self.last_report_steps = self.num_timesteps
+        super()._on_training_start()
+
+    def _on_rollout_start(self):
+        if self.rollout_end_time is not None:
+            self.timer.add("train", time.perf_counter() - self.rollout_end_time)
+        super()._on_rollout_start()
+
+    def _on_step(self) -> bool:
+        with self.timer.time("callbacks"):
+            return super()._on_step()
+
+    def _on_rollout_end(self):
+        with self.timer.time("callbacks"):
+            super()._on_rollout_end()
+        self.report()
+        self.rollout_end_time = time.perf_counter()
+
+    def report(self) -> dict:
+        now = time.perf_counter()
+        wall_time = now - self.last_report_time
+        steps = self.num_timesteps - self.last_report_steps
+        stats = self.timer.pop()
+        record = {"timesteps": self.num_timesteps, "wall_s": wall_time, "steps_per_second": steps / wall_time if wall_time > 0 else 0.0}
+        for stage, stage_stats in stats.items():
+            record[stage + "_total_s"] = stage_stats["total_s"]
+            record[stage + "_mean_ms"] = 1000.0 * stage_stats["total_s"] / stage_stats["calls"] if stage_stats["calls"] else 0.0
+            record[stage + "_fraction"] = stage_stats["total_s"] / wall_time if wall_time > 0 else 0.0
+            self.logger.record(f"timing/{stage}_mean_ms", record[stage + "_mean_ms"])
+            self.logger.record(f"timing/{stage}_fraction", record[stage + "_fraction"])
+        self.logger.record("timing/steps_per_second", record["steps_per_second"])
+        self.history.append(record)
+        if self.output_path is not None:
+            with open(self.output_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        if self.verbose > 0:
+            print(json.dumps(record))
+        self.last_report_time = now
+        self.last_report_steps = self.num_timesteps
+        return record
+
+    def _on_training_end(self):
+        # Updates after the last rollout
+        if self.rollout_end_time is not None:
+            self.timer.add("train", time.perf_counter() - self.rollout_end_time)
+        with self.timer.time("callbacks"):
+            super()._on_training_end()
+        self.report()
+        self.logger.dump(self.num_timesteps)
+        self.model.env = self.model.env.venv
+        _restore_method(self.model.policy, "forward")
+        _restore_method(self.model.policy, "_predict")
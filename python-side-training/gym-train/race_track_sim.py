@@ -0,0 +1,460 @@
+"""
+Headless NumPy port of the Unity race track environment (4-ML-AgentsEnvironment scene).
+Observation and action spaces are the same as the ones exposed by UnityToGymWrapper,
+so a model pretrained here can be loaded and fine-tuned in Unity.
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import gym
+import numpy as np
+from gym import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+from batched_vec_env import BatchedVecEnv
+
+# Race track generation, values from the scene
+RANGE_X = 100
+RANGE_Y = 100
+NUMBER_OF_POINTS = 25
+CONCAVE_POINTS_PERCENTAGE = 0.5
+BEZIER_SPACING = 3.0
+ROAD_WIDTH = 1.5
+
+# Lidar, values from HokuyoUST-10LX prefab
+LIDAR_HORIZONTAL_STEPS = 1081
+LIDAR_MIN_H_ANGLE = -135.0
+LIDAR_MAX_H_ANGLE = 135.0
+LIDAR_MAX_RANGE = 30.0
+
+# Agent, values from RaceCarAgent in the scene
+MAX_ACCELERATION = 1.5
+MAX_STEER_ANGLE = 35.0
+TRACK_FINISHED_REWARD = 1500.0
+TIME_ELAPSED_PENALTY = -0.1
+AGENT_FELL_OFF_PENALTY = -100.0
+MIN_SCORE_THRESHOLD = -150.0
+EPISODE_START_TIME = 60.0
+EPISODE_TIME_INCREMENT = 10.0
+PENALTY_INTERVAL = 1.0
+
+# Kinematic car model, approximation of F1Tenth vehicle
+WHEELBASE = 0.33
+MAX_SPEED = 5.0
+DRAG = 0.5
+
+# Physics step from ProjectSettings/TimeManager.asset, decision period of the agent's DecisionRequester
+FIXED_TIMESTEP = 0.005
+DECISION_PERIOD = 10
+DECISION_INTERVAL = FIXED_TIMESTEP * DECISION_PERIOD
+
+# Maximum number of points of a smoothed path, arrays of all tracks are padded to it
+MAX_PATH_POINTS = 256
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def generate_random_points(rng: np.random.Generator, n_points: int, range_x: int, range_y: int) -> np.ndarray:
+    points = np.stack([rng.integers(0, range_x, n_points), rng.integers(0, range_y, n_points)], axis=1)
+    # Consider only unique points
+    return np.unique(points.astype(np.float64), axis=0)
+
+
+def gift_wrap(points: np.ndarray) -> np.ndarray:
+    # Find the leftmost point, it is guaranteed to be on the hull
+    most_left_idx = int(np.argmin(points[:, 0]))
+    hull = [most_left_idx]
+
+    # Iterate over the points and determine which lay on the convex hull
+    current_idx = most_left_idx
+    for _ in range(len(points)):
+        candidate_idx = (current_idx + 1) % len(points)
+        # Point most to the left has positive cross product with the current candidate direction
+        directions = points - points[current_idx]
+        for i in range(len(points)):
+            if i == current_idx or i == candidate_idx:
+                continue
+            if _cross(directions[candidate_idx], directions[i]) > 0:
+                candidate_idx = i
+        # All convex hull points were found
+        if candidate_idx == most_left_idx:
+            break
+        hull.append(candidate_idx)
+        current_idx = candidate_idx
+    return points[hull]
+
+
+def draw_clamped_gaussian(rng: np.random.Generator, n: int, mean: float = 0.5, std_dev: float = 1.0) -> np.ndarray:
+    samples = rng.normal(mean, std_dev, n)
+    invalid = (samples < 0.0) | (samples > 1.0)
+    while invalid.any():
+        samples[invalid] = rng.normal(mean, std_dev, int(invalid.sum()))
+        invalid = (samples < 0.0) | (samples > 1.0)
+    return samples
+
+
+def displace_concave(rng: np.random.Generator, path: np.ndarray, concave_points_percentage: float) -> np.ndarray:
+    concave_points_n = math.ceil(len(path) * concave_points_percentage)
+    concave_idx = rng.choice(len(path), concave_points_n, replace=False)
+
+    # Lerp randomly picked points towards center of mass of a convex hull
+    inner_bound = path.mean(axis=0)
+    percentile = draw_clamped_gaussian(rng, concave_points_n)
+    concave_path = path.copy()
+    concave_path[concave_idx] = inner_bound + (path[concave_idx] - inner_bound) * percentile[:, None]
+    return concave_path
+
+
+def bezier_smooth(anchors: np.ndarray, spacing: float = BEZIER_SPACING, samples_per_segment: int = 32) -> np.ndarray:
+    # Closed path with automatically set control points, as in BezierPath.AllControlPointsAutoSet
+    to_prev = np.roll(anchors, 1, axis=0) - anchors
+    to_next = np.roll(anchors, -1, axis=0) - anchors
+    dist_prev = np.linalg.norm(to_prev, axis=1, keepdims=True)
+    dist_next = np.linalg.norm(to_next, axis=1, keepdims=True)
+    direction = _normalize(to_prev / dist_prev - to_next / dist_next)
+    control_before = anchors + direction * dist_prev * 0.5
+    control_after = anchors - direction * dist_next * 0.5
+
+    # Evaluate cubic segments densely
+    p0 = anchors[:, None, :]
+    p1 = control_after[:, None, :]
+    p2 = np.roll(control_before, -1, axis=0)[:, None, :]
+    p3 = np.roll(anchors, -1, axis=0)[:, None, :]
+    t = np.linspace(0.0, 1.0, samples_per_segment, endpoint=False)[None, :, None]
+    curve = (1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1 + 3 * (1 - t) * t ** 2 * p2 + t ** 3 * p3
+    curve = np.concatenate([curve.reshape(-1, 2), anchors[:1]])
+
+    # Resample evenly spaced points, as in BezierPath.CalculateEvenlySpacedPoints
+    arc_length = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(curve, axis=0), axis=1))])
+    distances = np.arange(0.0, arc_length[-1] - spacing * 0.5, spacing)
+    return np.stack([np.interp(distances, arc_length, curve[:, 0]), np.interp(distances, arc_length, curve[:, 1])], axis=1)
+
+
+def is_path_valid(path: np.ndarray, road_width: float = ROAD_WIDTH, spacing: float = BEZIER_SPACING) -> bool:
+    # Replacement of RaceTrackMeshArtifactDetector, track must not overlap itself and must not
+    # have turns so sharp that inner walls cross
+    if len(path) < 4 or len(path) > MAX_PATH_POINTS:
+        return False
+    forward = _normalize(np.roll(path, -1, axis=0) - path)
+    backward = _normalize(path - np.roll(path, 1, axis=0))
+    if np.any(np.sum(forward * backward, axis=1) < 0.0):
+        return False
+    distances = np.linalg.norm(path[:, None, :] - path[None, :, :], axis=-1)
+    idx = np.arange(len(path))
+    index_gap = np.abs(idx[:, None] - idx[None, :])
+    index_gap = np.minimum(index_gap, len(path) - index_gap)
+    far_along_path = index_gap * spacing > 2.0 * road_width + spacing
+    return not np.any(distances[far_along_path] < 2.0 * road_width)
+
+
+def create_race_track_path(rng: np.random.Generator) -> np.ndarray:
+    while True:
+        points = generate_random_points(rng, NUMBER_OF_POINTS, RANGE_X, RANGE_Y)
+        if len(points) < 3:
+            continue
+        anchors = displace_concave(rng, gift_wrap(points), CONCAVE_POINTS_PERCENTAGE)
+        path = bezier_smooth(anchors)
+        if is_path_valid(path):
+            return path
+
+
+def point_segment_distance(points: np.ndarray, seg_start: np.ndarray, seg_vec: np.ndarray) -> np.ndarray:
+    # points (E, 2), segments (E, S, 2) -> distances (E, S)
+    rel = points[:, None, :] - seg_start
+    seg_len_sq = np.maximum(np.sum(seg_vec * seg_vec, axis=-1), 1e-12)
+    t = np.clip(np.sum(rel * seg_vec, axis=-1) / seg_len_sq, 0.0, 1.0)
+    return np.linalg.norm(rel - t[..., None] * seg_vec, axis=-1)
+
+
+def segments_intersect(a_start: np.ndarray, a_vec: np.ndarray, b_start: np.ndarray, b_vec: np.ndarray) -> np.ndarray:
+    # One segment per env (E, 2) against many segments per env (E, S, 2) -> (E, S)
+    rel = b_start - a_start[:, None, :]
+    denom = _cross(a_vec[:, None, :], b_vec)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(rel, b_vec) / denom
+        u = _cross(rel, a_vec[:, None, :]) / denom
+    return (denom != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+
+
+def _wrap_angle(angle: np.ndarray) -> np.ndarray:
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def cast_rays(origins: np.ndarray, headings: np.ndarray, ray_offsets: np.ndarray, seg_start: np.ndarray, seg_vec: np.ndarray, seg_mask: np.ndarray, max_range: float) -> np.ndarray:
+    """
+    Vectorized 2D raycaster, returns distance to the closest wall for every ray.
+    Each segment is tested only against the rays within its angular span, so the cost grows
+    with number of ray hits instead of number of rays times number of segments.
+    origins (E, 2), headings (E,), evenly spaced ray_offsets (R,), segments (E, S, 2), seg_mask (E, S) -> distances (E, R)
+    """
+    n_envs, n_rays = len(origins), len(ray_offsets)
+    first_offset, offset_step = ray_offsets[0], ray_offsets[1] - ray_offsets[0]
+    # Walls out of lidar range are never hit
+    in_range = seg_mask & (point_segment_distance(origins, seg_start, seg_vec) < max_range)
+    env_idx, seg_idx = np.nonzero(in_range)
+    rel = seg_start[env_idx, seg_idx] - origins[env_idx]
+    vec = seg_vec[env_idx, seg_idx]
+
+    # Angular span of every segment relative to car heading
+    angle_start = np.arctan2(rel[:, 1], rel[:, 0])
+    angle_end = np.arctan2(rel[:, 1] + vec[:, 1], rel[:, 0] + vec[:, 0])
+    span = _wrap_angle(angle_end - angle_start)
+    angle_start = _wrap_angle(angle_start - headings[env_idx])
+    angle_lo = angle_start + np.minimum(span, 0.0)
+    angle_hi = angle_start + np.maximum(span, 0.0)
+
+    # Span converted to ray indexes, widened by one ray, shifted copies handle spans crossing -pi / pi
+    owners, first_rays, lengths = [], [], []
+    for shift in (-2 * np.pi, 0.0, 2 * np.pi):
+        idx_a = (angle_lo + shift - first_offset) / offset_step
+        idx_b = (angle_hi + shift - first_offset) / offset_step
+        first_ray = np.maximum(np.floor(np.minimum(idx_a, idx_b)).astype(np.int64), 0)
+        last_ray = np.minimum(np.ceil(np.maximum(idx_a, idx_b)).astype(np.int64), n_rays - 1)
+        length = np.maximum(last_ray - first_ray + 1, 0)
+        nonempty = np.flatnonzero(length)
+        owners.append(nonempty)
+        first_rays.append(first_ray[nonempty])
+        lengths.append(length[nonempty])
+    owners, first_rays, lengths = np.concatenate(owners), np.concatenate(first_rays), np.concatenate(lengths)
+
+    # Expand to ray / segment pairs
+    pair_owner = np.repeat(owners, lengths)
+    pair_ray = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(first_rays, lengths)
+    pair_env = env_idx[pair_owner]
+    ray_angle = headings[pair_env] + ray_offsets[pair_ray]
+    ray_dir = np.stack([np.cos(ray_angle), np.sin(ray_angle)], axis=1)
+
+    # Solve origin + t * dir = start + u * vec for every pair
+    pair_rel, pair_vec = rel[pair_owner], vec[pair_owner]
+    denom = _cross(ray_dir, pair_vec)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(pair_rel, pair_vec) / denom
+        u = _cross(pair_rel, ray_dir) / denom
+    hit = (t >= 0) & (u >= 0) & (u <= 1)
+
+    distances = np.full(n_envs * n_rays, max_range)
+    np.minimum.at(distances, pair_env[hit] * n_rays + pair_ray[hit], t[hit])
+    return distances.reshape(n_envs, n_rays)
+
+
+class RaceTrackSimulator:
+    """
+    Batch of independent cars, each on its own randomly generated race track.
+    All cars are stepped together with array operations.
+    """
+    def __init__(self, num_cars: int, seed: Optional[int] = None, decision_interval: float = DECISION_INTERVAL):
+        self.num_cars = num_cars
+        self.decision_interval = decision_interval
+        self.rng = np.random.default_rng(seed)
+        self.ray_offsets = np.deg2rad(np.linspace(LIDAR_MAX_H_ANGLE, LIDAR_MIN_H_ANGLE, LIDAR_HORIZONTAL_STEPS))
+
+        # Track geometry, padded to MAX_PATH_POINTS
+        self.center_start = np.zeros((num_cars, MAX_PATH_POINTS, 2))
+        self.center_vec = np.zeros((num_cars, MAX_PATH_POINTS, 2))
+        self.wall_start = np.zeros((num_cars, 2 * MAX_PATH_POINTS, 2))
+        self.wall_vec = np.zeros((num_cars, 2 * MAX_PATH_POINTS, 2))
+        self.wall_mask = np.zeros((num_cars, 2 * MAX_PATH_POINTS), dtype=bool)
+        self.path_mask = np.zeros((num_cars, MAX_PATH_POINTS), dtype=bool)
+        self.checkpoint_start = np.zeros((num_cars, MAX_PATH_POINTS, 2))
+        self.checkpoint_vec = np.zeros((num_cars, MAX_PATH_POINTS, 2))
+        self.checkpoint_alive = np.zeros((num_cars, MAX_PATH_POINTS), dtype=bool)
+        self.checkpoint_reward = np.zeros(num_cars)
+
+        # Car state
+        self.position = np.zeros((num_cars, 2))
+        self.heading = np.zeros(num_cars)
+        self.speed = np.zeros(num_cars)
+
+        # Episode state
+        self.score = np.zeros(num_cars)
+        self.elapsed = np.zeros(num_cars)
+        self.episode_time = np.full(num_cars, EPISODE_START_TIME)
+
+    def reset(self, indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        indices = np.arange(self.num_cars) if indices is None else np.asarray(indices)
+        for i in indices:
+            self._reset_car(i)
+        return self.observe(indices)
+
+    def _reset_car(self, i: int):
+        # Spawn race track
+        path = create_race_track_path(self.rng)
+        n = len(path)
+        next_path = np.roll(path, -1, axis=0)
+        forward = _normalize(next_path - np.roll(path, 1, axis=0))
+        side = np.stack([-forward[:, 1], forward[:, 0]], axis=1) * 0.5 * ROAD_WIDTH
+        left, right = path + side, path - side
+
+        self.path_mask[i] = False
+        self.path_mask[i, :n] = True
+        self.center_start[i] = 0.0
+        self.center_vec[i] = 0.0
+        self.center_start[i, :n] = path
+        self.center_vec[i, :n] = next_path - path
+
+        self.wall_mask[i] = False
+        self.wall_mask[i, :n] = True
+        self.wall_mask[i, MAX_PATH_POINTS:MAX_PATH_POINTS + n] = True
+        self.wall_start[i] = 0.0
+        self.wall_vec[i] = 0.0
+        self.wall_start[i, :n] = left
+        self.wall_vec[i, :n] = np.roll(left, -1, axis=0) - left
+        self.wall_start[i, MAX_PATH_POINTS:MAX_PATH_POINTS + n] = right
+        self.wall_vec[i, MAX_PATH_POINTS:MAX_PATH_POINTS + n] = np.roll(right, -1, axis=0) - right
+
+        # Checkpoints span the road across every path point
+        self.checkpoint_start[i] = 0.0
+        self.checkpoint_vec[i] = 0.0
+        self.checkpoint_start[i, :n] = left
+        self.checkpoint_vec[i, :n] = right - left
+        self.checkpoint_alive[i] = self.path_mask[i]
+        # Adjust reward for checkpoint, so longer track will award the same amount as short track
+        self.checkpoint_reward[i] = TRACK_FINISHED_REWARD / n
+
+        # Spawn between first two checkpoints, randomly change driving direction
+        start = (path[0] + path[1]) * 0.5
+        direction = path[1] - start
+        if self.rng.random() > 0.5:
+            direction = -direction
+        self.position[i] = start
+        self.heading[i] = math.atan2(direction[1], direction[0])
+        self.speed[i] = 0.0
+
+        self.score[i] = 0.0
+        self.elapsed[i] = 0.0
+
+    def observe(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        indices = np.arange(self.num_cars) if indices is None else indices
+        distances = cast_rays(
+            self.position[indices], self.heading[indices], self.ray_offsets,
+            self.wall_start[indices], self.wall_vec[indices], self.wall_mask[indices],
+            LIDAR_MAX_RANGE
+        )
+        return distances / LIDAR_MAX_RANGE
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        actions = np.clip(np.asarray(actions, dtype=np.float64).reshape(self.num_cars, 2), -1.0, 1.0)
+        dt = self.decision_interval
+        rewards = np.zeros(self.num_cars)
+
+        # Kinematic bicycle model, positive steering turns right as in Unity
+        acceleration = MAX_ACCELERATION * actions[:, 0]
+        steer = np.deg2rad(MAX_STEER_ANGLE * actions[:, 1])
+        self.speed = np.clip(self.speed + (acceleration - DRAG * self.speed) * dt, -MAX_SPEED, MAX_SPEED)
+        self.heading = self.heading - self.speed / WHEELBASE * np.tan(steer) * dt
+        movement = np.stack([np.cos(self.heading), np.sin(self.heading)], axis=1) * (self.speed * dt)[:, None]
+        previous_position = self.position
+        self.position = previous_position + movement
+
+        # Checkpoints crossed during this step
+        crossed = segments_intersect(previous_position, movement, self.checkpoint_start, self.checkpoint_vec) & self.checkpoint_alive
+        self.checkpoint_alive &= ~crossed
+        rewards += crossed.sum(axis=1) * self.checkpoint_reward
+
+        # Time penalty is added every PENALTY_INTERVAL seconds
+        new_elapsed = self.elapsed + dt
+        penalties = np.floor(new_elapsed / PENALTY_INTERVAL) - np.floor(self.elapsed / PENALTY_INTERVAL)
+        rewards += penalties * TIME_ELAPSED_PENALTY
+        self.elapsed = new_elapsed
+
+        # If all checkpoints were scored add big reward
+        finished = ~self.checkpoint_alive.any(axis=1)
+        rewards += finished * TRACK_FINISHED_REWARD
+
+        # Car that leaves the road falls off the track
+        distance_to_center = np.where(
+            self.path_mask,
+            point_segment_distance(self.position, self.center_start, self.center_vec),
+            np.inf
+        ).min(axis=1)
+        fell_off = ~finished & (distance_to_center > 0.5 * ROAD_WIDTH)
+        rewards += fell_off * AGENT_FELL_OFF_PENALTY
+
+        self.score += rewards
+        below_threshold = self.score <= MIN_SCORE_THRESHOLD
+
+        # Episode timeout extends time of the next episode
+        timeout = self.elapsed >= self.episode_time
+        self.episode_time += timeout * EPISODE_TIME_INCREMENT
+
+        dones = finished | fell_off | below_threshold | timeout
+        infos = [
+            {"finished": bool(finished[i]), "fell_off": bool(fell_off[i]), "TimeLimit.truncated": bool(timeout[i] and not (finished[i] or fell_off[i] or below_threshold[i]))}
+            for i in range(self.num_cars)
+        ]
+        return self.observe(), rewards.astype(np.float32), dones, infos
+
+
+def _observation_space() -> spaces.Box:
+    # Same as UnityToGymWrapper, so models are interchangeable between simulators
+    return spaces.Box(-np.inf, np.inf, shape=(LIDAR_HORIZONTAL_STEPS,), dtype=np.float32)
+
+
+def _action_space() -> spaces.Box:
+    return spaces.Box(-np.ones(2), np.ones(2), dtype=np.float32)
+
+
+class RaceTrackEnv(gym.Env):
+    """
+    Single car gym environment, drop-in replacement for Unity environment
+    """
+    metadata = {"render.modes": []}
+
+    def __init__(self, seed: Optional[int] = None):
+        self.sim = RaceTrackSimulator(1, seed)
+        self.observation_space = _observation_space()
+        self.action_space = _action_space()
+
+    def reset(self):
+        return self.sim.reset()[0].astype(np.float32)
+
+    def step(self, action):
+        obs, rewards, dones, infos = self.sim.step(action)
+        return obs[0].astype(np.float32), float(rewards[0]), bool(dones[0]), infos[0]
+
+    def seed(self, seed: Optional[int] = None):
+        self.sim.rng = np.random.default_rng(seed)
+        return [seed]
+
+
+class RaceTrackVecEnv(BatchedVecEnv):
+    """
+    Batched race track environment, all cars are stepped in one array operation.
+    Finished cars are reset automatically, as in other SB3 vectorized environments.
+    """
+    def __init__(self, num_envs: int, seed: Optional[int] = None):
+        super().__init__(num_envs, _observation_space(), _action_space())
+        self.sim = RaceTrackSimulator(num_envs, seed)
+        self.actions = np.zeros((num_envs, 2), dtype=np.float32)
+
+    def reset(self) -> VecEnvObs:
+        return self.sim.reset().astype(np.float32)
+
+    def step_async(self, actions: np.ndarray):
+        self.actions = actions
+
+    def step_wait(self) -> VecEnvStepReturn:
+        obs, rewards, dones, infos = self.sim.step(self.actions)
+        obs = obs.astype(np.float32)
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx) > 0:
+            for i in done_idx:
+                infos[i]["terminal_observation"] = obs[i].copy()
+            obs[done_idx] = self.sim.reset(done_idx)
+        return obs, rewards, dones, infos
+
+    def close(self):
+        pass
+
+    def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+        self.sim.rng = np.random.default_rng(seed)
+        return [seed] * self.num_envs
+
+
+gym.register(id="RaceTrackSim-v0", entry_point="race_track_sim:RaceTrackEnv")
@@ -0,0 +1,236 @@
+"""
+Recording of simulator rollouts to append-only binary files and streaming them back through
+memory maps. Recording directory layout:
+
+- meta.json - shapes and dtypes of the arrays
+- observations.bin, actions.bin, rewards.bin, dones.bin - one row per transition
+- terminal_observations.bin - observation after the last transition, one row per episode
+- episodes.bin - episode index, start row, length and return
+
+Episodes are buffered in memory and written only when they end, episode index row is written
+last, so a crash never leaves a partially indexed episode. Leftovers of such crash are cut off
+when the directory is opened for recording again.
+"""
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import gym
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv, VecEnvWrapper
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+EPISODE_DTYPE = np.dtype([("start", np.int64), ("length", np.int64), ("return", np.float64)])
+STEP_ARRAYS = ("observations", "actions", "rewards", "dones")
+
+
+def _row_dtypes(meta: dict) -> Dict[str, Tuple[Tuple[int, ...], np.dtype]]:
+    return {
+        "observations": (tuple(meta["obs_shape"]), np.dtype(meta["obs_dtype"])),
+        "actions": (tuple(meta["action_shape"]), np.dtype(meta["action_dtype"])),
+        "rewards": ((), np.dtype(np.float32)),
+        "dones": ((), np.dtype(np.bool_)),
+        "terminal_observations": (tuple(meta["obs_shape"]), np.dtype(meta["obs_dtype"])),
+    }
+
+
+class RolloutWriter:
+    """
+    Appends complete episodes to a recording directory. Transitions of several concurrent
+    episodes (vectorized envs, multiple agents) are kept apart by slot number.
+    """
+    def __init__(self, path: str, observation_space: gym.spaces.Box, action_space: gym.spaces.Space):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta = {
+            "obs_shape": list(observation_space.shape),
+            "obs_dtype": np.dtype(observation_space.dtype).name,
+            "action_shape": list(action_space.shape),
+            "action_dtype": np.dtype(action_space.dtype).name,
+        }
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                if json.load(f) != meta:
+                    raise ValueError(f"Recording {path} has different observation or action spaces")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        self.rows = _row_dtypes(meta)
+        self.n_rows, self.n_episodes = self._truncate_uncommitted()
+        self.files = {name: open(os.path.join(path, name + ".bin"), "ab") for name in self.rows}
+        self.episodes_file = open(os.path.join(path, "episodes.bin"), "ab")
+        self.buffers: Dict[int, Dict[str, List[np.ndarray]]] = {}
+
+    def _truncate_uncommitted(self) -> Tuple[int, int]:
+        # Cut off data written after the last indexed episode
+        episodes_path = os.path.join(self.path, "episodes.bin")
+        n_episodes = os.path.getsize(episodes_path) // EPISODE_DTYPE.itemsize if os.path.exists(episodes_path) else 0
+        n_rows = 0
+        if n_episodes > 0:
+            last = np.fromfile(episodes_path, dtype=EPISODE_DTYPE, count=1, offset=(n_episodes - 1) * EPISODE_DTYPE.itemsize)[0]
+            n_rows = int(last["start"] + last["length"])
+        sizes = {name: n_episodes if name == "terminal_observations" else n_rows for name in self.rows}
+        sizes["episodes"] = n_episodes
+        for name, count in sizes.items():
+            file_path = os.path.join(self.path, name + ".bin")
+            row_bytes = EPISODE_DTYPE.itemsize if name == "episodes" else self._row_bytes(name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) > count * row_bytes:
+                os.truncate(file_path, count * row_bytes)
+        return n_rows, n_episodes
+
+    def _row_bytes(self, name: str) -> int:
+        shape, dtype = self.rows[name]
+        return int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+    def add(self, slot: int, obs: np.ndarray, action: np.ndarray, reward: float, done: bool):
+        buffer = self.buffers.setdefault(slot, {name: [] for name in STEP_ARRAYS})
+        buffer["observations"].append(obs)
+        buffer["actions"].append(action)
+        buffer["rewards"].append(reward)
+        buffer["dones"].append(done)
+
+    def end_episode(self, slot: int, terminal_obs: np.ndarray):
+        buffer = self.buffers.pop(slot, None)
+        if buffer is None or not buffer["rewards"]:
+            return
+        length = len(buffer["rewards"])
+        for name in STEP_ARRAYS:
+            shape, dtype = self.rows[name]
+            self.files[name].write(np.asarray(buffer[name], dtype=dtype).reshape((length,) + shape).tobytes())
+        shape, dtype = self.rows["terminal_observations"]
+        self.files["terminal_observations"].write(np.asarray(terminal_obs, dtype=dtype).reshape(shape).tobytes())
+        for f in self.files.values():
+            f.flush()
+        # Index row commits the episode
+        episode = np.array([(self.n_rows, length, float(np.sum(buffer["rewards"])))], dtype=EPISODE_DTYPE)
+        self.episodes_file.write(episode.tobytes())
+        self.episodes_file.flush()
+        self.n_rows += length
+        self.n_episodes += 1
+
+    def close(self):
+        # Unfinished episodes are dropped
+        self.buffers.clear()
+        for f in self.files.values():
+            f.close()
+        self.episodes_file.close()
+
+
+class RolloutRecorder(gym.Wrapper):
+    def __init__(self, env: gym.Env, path: str):
+        super().__init__(env)
+        self.writer = RolloutWriter(path, env.observation_space, env.action_space)
+        self.last_obs = None
+
+    def reset(self, **kwargs):
+        self.last_obs = self.env.reset(**kwargs)
+        return self.last_obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        self.writer.add(0, self.last_obs, action, reward, done)
+        if done:
+            self.writer.end_episode(0, obs)
+        self.last_obs = obs
+        return obs, reward, done, info
+
+    def close(self):
+        self.writer.close()
+        return self.env.close()
+
+
+class VecRolloutRecorder(VecEnvWrapper):
+    def __init__(self, venv: VecEnv, path: str):
+        super().__init__(venv)
+        self.writer = RolloutWriter(path, venv.observation_space, venv.action_space)
+        self.last_obs = None
+        self.actions = None
+
+    def reset(self) -> VecEnvObs:
+        self.last_obs = self.venv.reset()
+        return self.last_obs
+
+    def step_async(self, actions: np.ndarray):
+        self.actions = actions
+        self.venv.step_async(actions)
+
+    def step_wait(self) -> VecEnvStepReturn:
+        obs, rewards, dones, infos = self.venv.step_wait()
+        for i in range(self.num_envs):
+            self.writer.add(i, self.last_obs[i], self.actions[i], rewards[i], dones[i])
+            if dones[i]:
+                self.writer.end_episode(i, infos[i]["terminal_observation"])
+        self.last_obs = obs
+        return obs, rewards, dones, infos
+
+    def close(self):
+        self.writer.close()
+        self.venv.close()
+
+
+def wrap_recorder(env, path: Optional[str]):
+    if not path:
+        return env
+    if isinstance(env, VecEnv):
+        return VecRolloutRecorder(env, path)
+    return RolloutRecorder(env, path)
+
+
+class RolloutDataset:
+    """
+    Read-only view of a recording, arrays are memory-mapped, so the recording does not have to fit into RAM.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.episodes = np.fromfile(os.path.join(path, "episodes.bin"), dtype=EPISODE_DTYPE)
+        self.n_rows = int(self.episodes["start"][-1] + self.episodes["length"][-1]) if len(self.episodes) else 0
+        self.arrays = {}
+        for name, (shape, dtype) in _row_dtypes(self.meta).items():
+            count = len(self.episodes) if name == "terminal_observations" else self.n_rows
+            if count == 0:
+                self.arrays[name] = np.empty((0,) + shape, dtype=dtype)
+            else:
+                self.arrays[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype, mode="r", shape=(count,) + shape)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def num_episodes(self) -> int:
+        return len(self.episodes)
+
+    def episode(self, index: int) -> Dict[str, np.ndarray]:
+        start, length = int(self.episodes["start"][index]), int(self.episodes["length"][index])
+        episode = {name: self.arrays[name][start:start + length] for name in STEP_ARRAYS}
+        episode["terminal_observation"] = self.arrays["terminal_observations"][index]
+        return episode
+
+    def _next_observations(self, rows: np.ndarray) -> np.ndarray:
+        episode_idx = np.searchsorted(self.episodes["start"], rows, side="right") - 1
+        is_last = rows == self.episodes["start"][episode_idx] + self.episodes["length"][episode_idx] - 1
+        next_obs = self.arrays["observations"][np.minimum(rows + 1, self.n_rows - 1)]
+        if is_last.any():
+            next_obs[is_last] = self.arrays["terminal_observations"][episode_idx[is_last]]
+        return next_obs
+
+    def iter_batches(self, batch_size: int, shuffle: bool = True, chunk_size: int = 65536, seed: Optional[int] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Streams transitions with next observations. With shuffle, contiguous chunks are read
+        in random order and shuffled in memory, so only one chunk is loaded at a time.
+        """
+        rng = np.random.default_rng(seed)
+        chunk_starts = np.arange(0, self.n_rows, chunk_size)
+        if shuffle:
+            rng.shuffle(chunk_starts)
+        for chunk_start in chunk_starts:
+            rows = np.arange(chunk_start, min(chunk_start + chunk_size, self.n_rows))
+            if shuffle:
+                rng.shuffle(rows)
+            # Sorted reads of a chunk are sequential on disk
+            for batch_start in range(0, len(rows), batch_size):
+                batch_rows = np.sort(rows[batch_start:batch_start + batch_size])
+                batch = {name: np.asarray(self.arrays[name][batch_rows]) for name in STEP_ARRAYS}
+                batch["next_observations"] = self._next_observations(batch_rows)
+                yield batch
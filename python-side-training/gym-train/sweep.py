@@ -0,0 +1,387 @@
+"""
+Hyperparameter sweep. Trials sampled from a YAML search space (see config/sweep_config.yaml)
+are trained concurrently, each in its own process with its own simulator ports and log
+directory. Intermediate eval rewards are reported to the scheduler, which stops trials doing
+worse than the median of other trials at the same number of steps. Results are collected
+in a leaderboard with configs and best checkpoints of all trials.
+
+Sweep directory layout:
+
+- trial_<k>/config.json - sampled hyperparameters
+- trial_<k>/best/best_model.zip - best evaluated checkpoint, evaluations.npz next to it
+- trial_<k>/checkpoint_<steps>_steps.zip - checkpoints, trial_<k>/tb_* - tensorboard logs
+- leaderboard.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+import yaml
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.utils import set_random_seed
+
+from utilities import *
+
+usage_message = """
+
+- Run sweep on NumPy simulator: python3 sweep.py --config ../../config/sweep_config.yaml
+- Run sweep on Unity builds, 2 trials at a time: python3 sweep.py --config ../../config/sweep_config.yaml --env unity --exec ../environment.x86_64 --max_concurrent 2
+- Evaluate the winner: python3 gym_interface.py --action eval --rl_algorithm PPO --model sweeps/<name>/trial_<k>/best/best_model.zip"""
+
+parser = argparse.ArgumentParser(
+    usage=usage_message,
+    description="Parallel hyperparameter sweep with early pruning of poorly performing trials"
+)
+parser.add_argument(
+    "-c", "--config",
+    action="store",
+    required=True,
+    help="YAML file with sweep settings and search space"
+)
+parser.add_argument(
+    "--name",
+    action="store",
+    help="Sweep name, results are saved to sweeps/<name>, defaults to current date"
+)
+parser.add_argument(
+    "--env",
+    action="store",
+    choices=["unity", "sim"],
+    help="Overrides env from config"
+)
+parser.add_argument(
+    "-e", "--exec",
+    action="store",
+    help="Overrides exec from config"
+)
+parser.add_argument(
+    "--max_concurrent",
+    type=int,
+    help="Overrides max_concurrent from config"
+)
+
+SWEEP_DEFAULTS = {
+    "rl_algorithm": "PPO",
+    "env": "sim",
+    "exec": None,
+    "time_scale": 20.0,
+    "num_envs": 1,
+    "steps": 100_000,
+    "trials": 8,
+    "max_concurrent": None,
+    "eval_freq": 10_000,
+    "n_eval_episodes": 5,
+    "seed": 0,
+    "pruning": {},
+    "search_space": {},
+}
+
+
+def load_sweep_config(path: str, overrides: Optional[dict] = None) -> dict:
+    with open(path) as f:
+        config = dict(SWEEP_DEFAULTS, **(yaml.safe_load(f) or {}))
+    config.update(overrides or {})
+    config["pruning"] = dict({"min_trials": 3, "warmup_steps": 0}, **(config["pruning"] or {}))
+    if config["rl_algorithm"] not in ("PPO", "A2C", "DQN", "RecurrentPPO"):
+        raise ValueError(f"Unknown algorithm {config['rl_algorithm']}")
+    # Trials run concurrently, Unity Editor can host only one environment
+    if config["env"] == "unity" and config["exec"] is None:
+        raise ValueError("Sweep on Unity requires exec file")
+    return config
+
+
+def sample_value(spec, rng: np.random.Generator):
+    if isinstance(spec, list):
+        return spec[rng.integers(len(spec))]
+    if isinstance(spec, dict) and "low" in spec and "high" in spec:
+        # PyYAML reads exponent notation without a dot as string
+        low, high = float(spec["low"]), float(spec["high"])
+        if spec.get("log", False):
+            value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            value = float(rng.uniform(low, high))
+        return int(round(value)) if spec.get("type") == "int" else value
+    return spec
+
+
+def sample_trials(config: dict) -> List[dict]:
+    rng = np.random.default_rng(config["seed"])
+    trials = []
+    for trial_id in range(config["trials"]):
+        hyperparameters = {name: sample_value(spec, rng) for name, spec in config["search_space"].items()}
+        obs_pipeline = hyperparameters.pop("obs_pipeline", None)
+        trials.append({
+            "trial_id": trial_id,
+            "seed": config["seed"] + trial_id,
+            "obs_pipeline": obs_pipeline,
+            "hyperparameters": hyperparameters,
+        })
+    return trials
+
+
+def should_prune(history: Dict[int, List[Tuple[int, float]]], trial_id: int, timesteps: int, min_trials: int, warmup_steps: int) -> bool:
+    """
+    Median rule, trial is pruned when its best reward so far is below the median of best
+    rewards of other trials that have already been evaluated at this number of steps
+    """
+    if timesteps < warmup_steps:
+        return False
+    best = max(reward for steps, reward in history[trial_id] if steps <= timesteps)
+    others = []
+    for other_id, reports in history.items():
+        if other_id == trial_id or not reports or reports[-1][0] < timesteps:
+            continue
+        rewards = [reward for steps, reward in reports if steps <= timesteps]
+        if rewards:
+            others.append(max(rewards))
+    if len(others) < min_trials:
+        return False
+    return best < float(np.median(others))
+
+
+class TrialReportCallback(BaseCallback):
+    """
+    Forwards eval results of the trial to the scheduler and stops training when the trial is
+    pruned or the sweep is interrupted
+    """
+    def __init__(self, eval_callback: AsyncEvalCallback, trial_id: int, results: multiprocessing.Queue, prune_event: multiprocessing.Event, interrupt_event: multiprocessing.Event):
+        super().__init__()
+        self.eval_callback = eval_callback
+        self.trial_id = trial_id
+        self.results = results
+        self.prune_event = prune_event
+        self.interrupt_event = interrupt_event
+        self.reported = 0
+
+    def _report(self):
+        for result in self.eval_callback.evaluations[self.reported:]:
+            self.results.put({"type": "eval", "trial_id": self.trial_id, "timesteps": result["timesteps"], "mean_reward": result["mean_reward"]})
+        self.reported = len(self.eval_callback.evaluations)
+
+    def _on_step(self) -> bool:
+        self._report()
+        if self.prune_event.is_set() or self.interrupt_event.is_set():
+            # Stopped trial does not need evaluation of its last checkpoint
+            self.eval_callback.abort()
+            return False
+        return True
+
+    def _on_training_end(self):
+        self._report()
+
+
+def run_trial(trial: dict, config: dict, trial_dir: str, base_worker_id: int, num_threads: int, results: multiprocessing.Queue, prune_event: multiprocessing.Event, interrupt_event: multiprocessing.Event):
+    # Concurrent trials share CPU cores
+    torch.set_num_threads(num_threads)
+    set_random_seed(trial["seed"])
+    status, error, timesteps = "completed", None, 0
+    env = None
+    try:
+        obs_pipeline = trial["obs_pipeline"]
+        if config["env"] == "sim":
+            env = prep_sim_env(config["num_envs"], trial["seed"], obs_pipeline)
+        else:
+            env = prep_vec_env(config["time_scale"], config["exec"], config["num_envs"], trial["seed"], base_worker_id, obs_pipeline)
+        hyperparameters = dict(trial["hyperparameters"], verbose=0, tensorboard_log=trial_dir)
+        model = prep_train_model(config["rl_algorithm"], env, hyperparameters)
+        save_obs_pipeline(obs_pipeline, "best", "checkpoint", trial_dir)
+        eval_env_fn, eval_simulator = prep_eval_env_fn(config["env"], config["time_scale"], config["exec"], config["num_envs"], obs_pipeline, base_worker_id, trial["seed"])
+        eval_callback, checkpoint_callback = prep_callbacks(
+            eval_env_fn, config["rl_algorithm"], "best", "checkpoint", config["num_envs"], trial_dir, config["eval_freq"],
+            eval_simulator=eval_simulator
+        )
+        eval_callback.n_eval_episodes = config["n_eval_episodes"]
+        eval_callback.verbose = 0
+        checkpoint_callback.verbose = 0
+        report_callback = TrialReportCallback(eval_callback, trial["trial_id"], results, prune_event, interrupt_event)
+        model.learn(total_timesteps=config["steps"], callback=[checkpoint_callback, eval_callback, report_callback], tb_log_name="tb")
+        timesteps = model.num_timesteps
+        if interrupt_event.is_set():
+            status = "interrupted"
+        elif prune_event.is_set():
+            status = "pruned"
+    except KeyboardInterrupt:
+        # Ctrl+C reaches trial processes too, simulators are still closed below
+        status = "interrupted"
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+    finally:
+        if env is not None:
+            env.close()
+        results.put({"type": "done", "trial_id": trial["trial_id"], "status": status, "timesteps": timesteps, "error": error})
+
+
+class SweepScheduler:
+    """
+    Runs trials in worker processes, at most max_concurrent at a time. Every running trial
+    holds a slot, slot determines the range of Unity worker ids (ports) used by the trial.
+    """
+    def __init__(self, config: dict, sweep_dir: str):
+        self.config = config
+        self.sweep_dir = sweep_dir
+        cpu_count = os.cpu_count() or 1
+        # Trial process with its eval worker, Unity trials also run num_envs + 1 simulators
+        processes_per_trial = config["num_envs"] + 1 if config["env"] == "unity" else 2
+        self.max_concurrent = config["max_concurrent"] or max(1, cpu_count // processes_per_trial)
+        self.num_threads = max(1, cpu_count // self.max_concurrent)
+        self.history: Dict[int, List[Tuple[int, float]]] = {}
+        self.outcomes: Dict[int, dict] = {}
+
+    def trial_dir(self, trial_id: int) -> str:
+        return os.path.join(self.sweep_dir, f"trial_{trial_id}")
+
+    def base_worker_id(self, slot: int) -> int:
+        # Worker id 0 is left free for the Unity Editor, eval simulator takes one id after the training ones
+        return 1 + slot * (self.config["num_envs"] + 1)
+
+    def run(self, trials: List[dict]) -> List[dict]:
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        pending = list(trials)
+        running = {}
+        free_slots = list(range(self.max_concurrent))
+        try:
+            while pending or running:
+                while pending and free_slots:
+                    trial = pending.pop(0)
+                    slot = free_slots.pop(0)
+                    trial_dir = self.trial_dir(trial["trial_id"])
+                    os.makedirs(trial_dir, exist_ok=True)
+                    with open(os.path.join(trial_dir, "config.json"), "w") as f:
+                        json.dump(trial, f, indent=2)
+                    prune_event = context.Event()
+                    interrupt_event = context.Event()
+                    # Not a daemon, trial starts its own simulator and eval processes
+                    process = context.Process(
+                        target=run_trial,
+                        args=(trial, self.config, trial_dir, self.base_worker_id(slot), self.num_threads, results, prune_event, interrupt_event)
+                    )
+                    process.start()
+                    self.history[trial["trial_id"]] = []
+                    running[trial["trial_id"]] = (process, prune_event, interrupt_event, slot)
+                    print(f"Trial {trial['trial_id']} started: {json.dumps(trial['hyperparameters'])} obs_pipeline={trial['obs_pipeline']}")
+
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    message = None
+                if message is not None:
+                    self.handle_message(message, running)
+
+                # Done message is sent before the process exits, a process gone without it crashed
+                for trial_id, (process, prune_event, interrupt_event, slot) in list(running.items()):
+                    if not process.is_alive() and trial_id in self.outcomes:
+                        process.join()
+                        free_slots.append(slot)
+                        del running[trial_id]
+                    elif not process.is_alive() and process.exitcode != 0:
+                        self.outcomes[trial_id] = {"status": "failed", "timesteps": 0, "error": f"Trial process exited with code {process.exitcode}"}
+                        print(f"Trial {trial_id} failed")
+                        free_slots.append(slot)
+                        del running[trial_id]
+        except KeyboardInterrupt:
+            print("Sweep interrupted, stopping running trials")
+        finally:
+            self.stop_trials(running, results)
+        return self.leaderboard(trials)
+
+    def stop_trials(self, running: dict, results: multiprocessing.Queue, timeout: float = 120.0):
+        # Trials stop like pruned ones, they close their simulators and report how far they got
+        for process, prune_event, interrupt_event, slot in running.values():
+            interrupt_event.set()
+        start = time.time()
+        # Messages are read while waiting, process cannot exit with unread items in the queue
+        while any(process.is_alive() for process, _, _, _ in running.values()) and time.time() - start < timeout:
+            try:
+                self.handle_message(results.get(timeout=1.0), running)
+            except queue.Empty:
+                pass
+        while True:
+            try:
+                self.handle_message(results.get_nowait(), running)
+            except queue.Empty:
+                break
+        for trial_id, (process, prune_event, interrupt_event, slot) in running.items():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            if trial_id not in self.outcomes:
+                self.outcomes[trial_id] = {"status": "interrupted", "timesteps": 0, "error": None}
+
+    def handle_message(self, message: dict, running: dict):
+        trial_id = message["trial_id"]
+        if message["type"] == "eval":
+            self.history[trial_id].append((message["timesteps"], message["mean_reward"]))
+            print(f"Trial {trial_id} at {message['timesteps']} steps: mean_reward={message['mean_reward']:.2f}")
+            pruning = self.config["pruning"]
+            prune_event = running[trial_id][1] if trial_id in running else None
+            if prune_event is not None and not prune_event.is_set() and should_prune(
+                self.history, trial_id, message["timesteps"], pruning["min_trials"], pruning["warmup_steps"]
+            ):
+                print(f"Trial {trial_id} pruned")
+                prune_event.set()
+        elif message["type"] == "done":
+            self.outcomes[trial_id] = {"status": message["status"], "timesteps": message["timesteps"], "error": message["error"]}
+            print(f"Trial {trial_id} {message['status']}")
+            if message["error"] is not None:
+                print(message["error"])
+
+    def leaderboard(self, trials: List[dict]) -> List[dict]:
+        entries = []
+        for trial in trials:
+            trial_id = trial["trial_id"]
+            outcome = self.outcomes.get(trial_id, {"status": "not started", "timesteps": 0, "error": None})
+            reports = self.history.get(trial_id, [])
+            best_steps, best_reward = max(reports, key=lambda report: report[1]) if reports else (None, None)
+            best_model = os.path.join(self.trial_dir(trial_id), "best", "best_model.zip")
+            entries.append(dict(
+                trial,
+                status=outcome["status"],
+                timesteps=outcome["timesteps"],
+                best_mean_reward=best_reward,
+                best_timesteps=best_steps,
+                best_model=best_model if os.path.exists(best_model) else None,
+                evaluations=reports,
+            ))
+        entries.sort(key=lambda entry: -np.inf if entry["best_mean_reward"] is None else entry["best_mean_reward"], reverse=True)
+        with open(os.path.join(self.sweep_dir, "leaderboard.json"), "w") as f:
+            json.dump(entries, f, indent=2)
+        return entries
+
+
+def print_leaderboard(entries: List[dict]):
+    print(f"{'rank':>4} {'trial':>5} {'status':>11} {'best reward':>12} {'at steps':>9}  best model / hyperparameters")
+    for rank, entry in enumerate(entries, start=1):
+        reward = f"{entry['best_mean_reward']:.2f}" if entry["best_mean_reward"] is not None else "-"
+        steps = entry["best_timesteps"] if entry["best_timesteps"] is not None else "-"
+        print(f"{rank:>4} {entry['trial_id']:>5} {entry['status']:>11} {reward:>12} {steps:>9}  {entry['best_model']}")
+        print(f"{'':>45}{json.dumps(entry['hyperparameters'])} obs_pipeline={entry['obs_pipeline']}")
+
+
+def main():
+    args = parser.parse_args()
+    overrides = {"env": args.env, "exec": args.exec, "max_concurrent": args.max_concurrent}
+    config = load_sweep_config(args.config, {key: value for key, value in overrides.items() if value is not None})
+    name = args.name or datetime.now().strftime("%d-%m-%Y-%H-%M-%S")
+    sweep_dir = os.path.join("sweeps", name)
+    os.makedirs(sweep_dir, exist_ok=True)
+    with open(os.path.join(sweep_dir, "sweep_config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+
+    scheduler = SweepScheduler(config, sweep_dir)
+    print(f"Sweep {name}: {config['trials']} trials, {scheduler.max_concurrent} at a time")
+    entries = scheduler.run(sample_trials(config))
+    print_leaderboard(entries)
+
+
+# Guard is required, trial processes re-import this module
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Many cars in one Unity scene exposed as one vectorized env through the ML-Agents low level API.
+Every car (agent) is an env slot. Decision and terminal steps of all cars are read in batches
+and actions of all cars are sent as one array, so a single Unity process feeds all of them.
+"""
+from typing import Any, Dict, List, Optional
+
+import gym
+import numpy as np
+from mlagents_envs.base_env import ActionTuple, BehaviorSpec
+from mlagents_envs.environment import UnityEnvironment
+from mlagents_envs.side_channel.engine_configuration_channel import EngineConfigurationChannel
+from stable_baselines3.common.vec_env.base_vec_env import VecEnvObs, VecEnvStepReturn
+
+from batched_vec_env import BatchedVecEnv
+
+
+def _vector_obs(obs: List[np.ndarray]) -> np.ndarray:
+    # Vector observations concatenated as in UnityToGymWrapper
+    return np.concatenate([o.reshape(len(o), -1) for o in obs if o.ndim == 2], axis=1).astype(np.float32)
+
+
+def _spaces(spec: BehaviorSpec):
+    obs_size = sum(int(np.prod(o.shape)) for o in spec.observation_specs if len(o.shape) == 1)
+    observation_space = gym.spaces.Box(-np.inf, np.inf, (obs_size,), dtype=np.float32)
+    action_spec = spec.action_spec
+    if action_spec.continuous_size > 0 and action_spec.discrete_size > 0:
+        raise ValueError("Hybrid continuous and discrete actions are not supported")
+    if action_spec.continuous_size > 0:
+        action_space = gym.spaces.Box(-1, 1, (action_spec.continuous_size,), dtype=np.float32)
+    elif action_spec.discrete_size == 1:
+        action_space = gym.spaces.Discrete(action_spec.discrete_branches[0])
+    else:
+        action_space = gym.spaces.MultiDiscrete(action_spec.discrete_branches)
+    return observation_space, action_space
+
+
+class UnityMultiAgentVecEnv(BatchedVecEnv):
+    """
+    Slots are assigned to agent ids when the scene is reset. Agent that respawns with a new id
+    takes the slot of an agent whose episode has just ended, also when it ends its episode
+    before its first decision. When cars do not request decisions
+    on the same academy step, the academy is stepped until every car has decided once, cars
+    repeat their last action meanwhile and their rewards are summed.
+    """
+    def __init__(self, unity_env: UnityEnvironment, behavior_name: Optional[str] = None, max_academy_steps: int = 1000):
+        self.unity_env = unity_env
+        self.max_academy_steps = max_academy_steps
+        self.unity_env.reset()
+        self.behavior_name = behavior_name or list(self.unity_env.behavior_specs.keys())[0]
+        self.spec = self.unity_env.behavior_specs[self.behavior_name]
+        decision_steps, _ = self.unity_env.get_steps(self.behavior_name)
+        if len(decision_steps) == 0:
+            raise RuntimeError(f"No agent of behavior {self.behavior_name} requested a decision after reset")
+        observation_space, action_space = _spaces(self.spec)
+        super().__init__(len(decision_steps), observation_space, action_space)
+        self.obs = np.zeros((self.num_envs,) + observation_space.shape, dtype=np.float32)
+        self._assign_slots(decision_steps)
+        self.actions = None
+
+    def _assign_slots(self, decision_steps):
+        self.agent_to_slot: Dict[int, int] = {int(agent_id): slot for slot, agent_id in enumerate(sorted(decision_steps.agent_id))}
+        self.decision_slots = np.array([self.agent_to_slot[int(agent_id)] for agent_id in decision_steps.agent_id], dtype=np.int64)
+        self.obs[self.decision_slots] = _vector_obs(decision_steps.obs)
+
+    def reset(self) -> VecEnvObs:
+        self.unity_env.reset()
+        decision_steps, _ = self.unity_env.get_steps(self.behavior_name)
+        if len(decision_steps) != self.num_envs:
+            raise RuntimeError(f"Scene has {len(decision_steps)} agents after reset, env was created with {self.num_envs}")
+        self._assign_slots(decision_steps)
+        return self.obs.copy()
+
+    def step_async(self, actions: np.ndarray):
+        self.actions = actions
+
+    def _send_actions(self):
+        # One batch in the order of agents in the last decision steps
+        actions = np.asarray(self.actions)[self.decision_slots]
+        if self.spec.action_spec.continuous_size > 0:
+            action_tuple = ActionTuple(continuous=actions.reshape(len(actions), -1).astype(np.float32))
+        else:
+            action_tuple = ActionTuple(discrete=actions.reshape(len(actions), -1).astype(np.int32))
+        self.unity_env.set_actions(self.behavior_name, action_tuple)
+
+    def step_wait(self) -> VecEnvStepReturn:
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos: List[Dict[str, Any]] = [{} for _ in range(self.num_envs)]
+        waiting = np.ones(self.num_envs, dtype=bool)
+        academy_steps = 0
+        self._send_actions()
+        while True:
+            self.unity_env.step()
+            decision_steps, terminal_steps = self.unity_env.get_steps(self.behavior_name)
+            if len(terminal_steps) > 0:
+                terminal_slots = self._agent_slots(terminal_steps.agent_id, dones & waiting)
+                terminal_obs = _vector_obs(terminal_steps.obs)
+                rewards[terminal_slots] += terminal_steps.reward
+                dones[terminal_slots] = True
+                for i, slot in enumerate(terminal_slots):
+                    infos[slot]["terminal_observation"] = terminal_obs[i]
+                    infos[slot]["TimeLimit.truncated"] = bool(terminal_steps.interrupted[i])
+            if len(decision_steps) > 0:
+                decision_slots = self._agent_slots(decision_steps.agent_id, dones & waiting)
+                rewards[decision_slots] += decision_steps.reward
+                self.obs[decision_slots] = _vector_obs(decision_steps.obs)
+                waiting[decision_slots] = False
+                self.decision_slots = decision_slots
+            if not waiting.any():
+                break
+            academy_steps += 1
+            if academy_steps > self.max_academy_steps:
+                raise RuntimeError(f"Env slots {np.flatnonzero(waiting).tolist()} got no decision in {self.max_academy_steps} academy steps")
+            # Cars that have already decided repeat their action until all cars have decided
+            if len(decision_steps) > 0:
+                self._send_actions()
+        return self.obs.copy(), rewards, dones, infos
+
+    def _agent_slots(self, agent_ids: np.ndarray, free: np.ndarray) -> np.ndarray:
+        slots = np.array([self.agent_to_slot.get(int(agent_id), -1) for agent_id in agent_ids], dtype=np.int64)
+        free = free.copy()
+        free[slots[slots >= 0]] = False
+        # Respawned agent takes a slot whose agent has ended its episode and has not come back
+        for i in np.flatnonzero(slots < 0):
+            free_slots = np.flatnonzero(free)
+            if len(free_slots) == 0:
+                raise RuntimeError(f"Agent {agent_ids[i]} appeared, but no env slot is free, the scene has more than {self.num_envs} agents")
+            slot = int(free_slots[0])
+            free[slot] = False
+            self.agent_to_slot = {a: s for a, s in self.agent_to_slot.items() if s != slot}
+            self.agent_to_slot[int(agent_ids[i])] = slot
+            slots[i] = slot
+        return slots
+
+    def close(self):
+        self.unity_env.close()
+
+    def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+        # Seed is passed to UnityEnvironment at launch
+        return [None] * self.num_envs
+
+
+def launch_multi_agent_env(exec_filename: Optional[str], worker_id: int, time_scale: float, seed: int = 0, no_graphics: bool = True) -> UnityMultiAgentVecEnv:
+    # Headless like the single agent builds, observations are ray casts and do not need rendering,
+    # ignored when training in the editor
+    engine_config_channel = EngineConfigurationChannel()
+    unity_env = UnityEnvironment(
+        file_name=exec_filename,
+        worker_id=worker_id,
+        seed=seed,
+        no_graphics=no_graphics,
+        side_channels=[engine_config_channel]
+    )
+    engine_config_channel.set_configuration_parameters(time_scale=time_scale)
+    return UnityMultiAgentVecEnv(unity_env)
@@ -0,0 +1,118 @@
+import time
+from collections import deque
+from functools import partial
+from typing import Callable, Optional
+
+import gym
+from mlagents_envs.envs.unity_gym_env import UnityToGymWrapper
+from mlagents_envs.environment import UnityEnvironment
+from mlagents_envs.exception import UnityCommunicationException, UnityTimeOutException, UnityWorkerInUseException
+from mlagents_envs.side_channel.engine_configuration_channel import EngineConfigurationChannel
+
+from stable_baselines3.common.monitor import Monitor
+
+from obs_preprocessing import wrap_env
+
+
+# Exceptions that mean the Unity process died or stopped answering
+UNITY_CRASH_EXCEPTIONS = (UnityCommunicationException, UnityTimeOutException, BrokenPipeError, ConnectionError)
+# Relaunch right after a crash may also find the port of the dead process still bound
+UNITY_LAUNCH_EXCEPTIONS = UNITY_CRASH_EXCEPTIONS + (UnityWorkerInUseException,)
+
+
+def launch_unity_env(exec_filename: Optional[str], worker_id: int, time_scale: float, seed: int, no_graphics: bool) -> UnityToGymWrapper:
+    engine_config_channel = EngineConfigurationChannel()
+    unity_env = UnityEnvironment(
+        file_name=exec_filename,
+        worker_id=worker_id,
+        seed=seed,
+        no_graphics=no_graphics,
+        side_channels=[engine_config_channel]
+    )
+    engine_config_channel.set_configuration_parameters(time_scale=time_scale)
+    return UnityToGymWrapper(unity_env, False, False, False, 1)
+
+
+class RestartingUnityEnv(gym.Wrapper):
+    """
+    Unity env that relaunches its simulator process when it crashes or times out.
+    Step that hits a crash ends the episode as truncated with the last good observation,
+    so the learner bootstraps its value instead of treating the crash as a terminal state,
+    and the next reset comes from the relaunched simulator. Failed relaunches are retried
+    after restart_delay seconds. Training is stopped when crashes and failed relaunches
+    together exceed max_restarts within restart_window seconds.
+    """
+    def __init__(self, exec_filename: Optional[str], worker_id: int, time_scale: float, seed: int, no_graphics: bool = True, max_restarts: int = 10, restart_window: float = 3600.0, restart_delay: float = 5.0):
+        self.exec_filename = exec_filename
+        self.worker_id = worker_id
+        self.time_scale = time_scale
+        self.seed_value = seed
+        self.no_graphics = no_graphics
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.restart_delay = restart_delay
+        self.restart_times = deque()
+        self.last_obs = None
+        super().__init__(self._launch())
+
+    def _launch(self) -> UnityToGymWrapper:
+        return launch_unity_env(self.exec_filename, self.worker_id, self.time_scale, self.seed_value, self.no_graphics)
+
+    def _count_restart(self, error: Exception):
+        now = time.monotonic()
+        while self.restart_times and now - self.restart_times[0] > self.restart_window:
+            self.restart_times.popleft()
+        if len(self.restart_times) >= self.max_restarts:
+            raise RuntimeError(f"Unity worker {self.worker_id} crashed or failed to relaunch more than {self.max_restarts} times in {self.restart_window:.0f} s") from error
+        self.restart_times.append(now)
+
+    def _restart(self, error: Exception):
+        try:
+            self.env.close()
+        except Exception:
+            pass
+        while True:
+            self._count_restart(error)
+            # New seed so the relaunched simulator does not replay the crashing episode
+            self.seed_value += 1
+            try:
+                self.env = self._launch()
+                return
+            except UNITY_LAUNCH_EXCEPTIONS as launch_error:
+                error = launch_error
+                time.sleep(self.restart_delay)
+
+    def reset(self, **kwargs):
+        while True:
+            try:
+                self.last_obs = self.env.reset(**kwargs)
+                return self.last_obs
+            except UNITY_CRASH_EXCEPTIONS as error:
+                self._restart(error)
+
+    def step(self, action):
+        try:
+            obs, reward, done, info = self.env.step(action)
+        except UNITY_CRASH_EXCEPTIONS as error:
+            # Reset of the relaunched simulator is left to the auto-reset of the vectorized env
+            self._restart(error)
+            return self.last_obs, 0.0, True, {"unity_restarted": True, "TimeLimit.truncated": True}
+        self.last_obs = obs
+        return obs, reward, done, info
+
+    def close(self):
+        try:
+            self.env.close()
+        except UNITY_CRASH_EXCEPTIONS:
+            pass
+
+
+def build_unity_env(exec_filename: str, worker_id: int, time_scale: float, seed: int, no_graphics: bool = True, obs_pipeline: Optional[str] = None) -> gym.Env:
+    env = RestartingUnityEnv(exec_filename, worker_id, time_scale, seed, no_graphics)
+    # Preprocessing in the worker also shrinks observations sent between processes
+    return wrap_env(Monitor(env), obs_pipeline)
+
+
+def make_unity_env(exec_filename: str, rank: int, time_scale: float, seed: int = 0, base_worker_id: int = 0, no_graphics: bool = True, obs_pipeline: Optional[str] = None) -> Callable[[], gym.Env]:
+    # Each worker gets its own port (worker_id) and seed, partial is picklable for spawned processes
+    return partial(build_unity_env, exec_filename, base_worker_id + rank, time_scale, seed + rank, no_graphics, obs_pipeline)
@@ -1,15 +1,27 @@
 import argparse
 from datetime import datetime
+from functools import partial
 import os
+import warnings
 
+import gym
 from mlagents_envs.envs.unity_gym_env import UnityToGymWrapper
 from mlagents_envs.environment import UnityEnvironment
 from mlagents_envs.side_channel.engine_configuration_channel import EngineConfigurationChannel
 
 from stable_baselines3 import A2C, PPO, DQN
 from sb3_contrib import RecurrentPPO
-from stable_baselines3.common.callbacks import EvalCallback
-from stable_baselines3.common.callbacks import CheckpointCallback
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecEnv, VecMonitor
+
+from async_eval import AsyncEvalCallback
+from checkpointing import BackgroundCheckpointCallback
+from inference import NumpyPolicy, export_policy
+from obs_preprocessing import PREPROCESSING_FILENAME, ObservationPipeline, PreprocessObservation, find_pipeline_spec, wrap_env
+from profiling import ProfilingCallback
+from race_track_sim import RaceTrackEnv, RaceTrackVecEnv
+from rollout_recorder import wrap_recorder
+from unity_multi_agent_env import launch_multi_agent_env
+from unity_vec_env import build_unity_env, make_unity_env
 
 from typing import Optional, Tuple, Type, Union, Callable
 
@@ -25,28 +37,59 @@ def float_range(min: float, max: float) -> callable:
     return float_range_checker
 
 
-def prep_env(time_scale: float, exec_filename: str) -> UnityToGymWrapper:
+def prep_env(time_scale: float, exec_filename: str, worker_id: int = 0, obs_pipeline: Optional[str] = None) -> Union[UnityToGymWrapper, PreprocessObservation]:
     engine_config_channel = EngineConfigurationChannel()
-    unity_env = UnityEnvironment(file_name=exec_filename, side_channels=[engine_config_channel])
+    unity_env = UnityEnvironment(file_name=exec_filename, worker_id=worker_id, side_channels=[engine_config_channel])
     engine_config_channel.set_configuration_parameters(time_scale=time_scale)
     env = UnityToGymWrapper(unity_env, False, False, False, 1)
+    env = wrap_env(env, obs_pipeline)
     return env
 
 
-def prep_train_model(rl_algorithm: str, env: UnityToGymWrapper) -> Union[PPO, A2C, DQN]:
+def prep_vec_env(time_scale: float, exec_filename: str, num_envs: int, seed: int = 0, base_worker_id: int = 1, obs_pipeline: Optional[str] = None) -> SubprocVecEnv:
+    # Every worker is a separate headless Unity process on its own port, worker_id 0
+    # is left free for the Unity Editor
+    if exec_filename is None:
+        raise argparse.ArgumentTypeError("Multiple environments require --exec, Unity Editor can host only one environment")
+    env_fns = [make_unity_env(exec_filename, rank, time_scale, seed, base_worker_id, obs_pipeline=obs_pipeline) for rank in range(num_envs)]
+    env = SubprocVecEnv(env_fns)
+    return env
+
+
+def prep_multi_agent_env(time_scale: float, exec_filename: Optional[str], worker_id: int = 0, seed: int = 0, obs_pipeline: Optional[str] = None) -> VecEnv:
+    # All cars of the scene run in one Unity process, every car is one env slot
+    env = VecMonitor(launch_multi_agent_env(exec_filename, worker_id, time_scale, seed))
+    return wrap_env(env, obs_pipeline)
+
+
+def prep_sim_env(num_envs: int, seed: int = 0, obs_pipeline: Optional[str] = None) -> Union[gym.Env, VecEnv]:
+    # Unity-free NumPy simulator, all cars are stepped in a single process
+    if num_envs == 1:
+        return wrap_env(RaceTrackEnv(seed), obs_pipeline)
+    env = wrap_env(VecMonitor(RaceTrackVecEnv(num_envs, seed)), obs_pipeline)
+    return env
+
+
+def prep_train_model(rl_algorithm: str, env: Union[UnityToGymWrapper, VecEnv], hyperparameters: Optional[dict] = None) -> Union[PPO, A2C, DQN]:
+    # Hyperparameters override algorithm defaults, e.g. learning_rate, n_steps, policy_kwargs
+    kwargs = {"verbose": 1, "tensorboard_log": "tensorboard"}
+    kwargs.update(hyperparameters or {})
     if rl_algorithm == "PPO":
-        new_model = PPO("MlpPolicy", env, verbose=1, tensorboard_log="tensorboard")
+        new_model = PPO("MlpPolicy", env, **kwargs)
     elif rl_algorithm == "A2C":
-        new_model = A2C("MlpPolicy", env, verbose=1, tensorboard_log="tensorboard")
+        new_model = A2C("MlpPolicy", env, **kwargs)
     elif rl_algorithm == "DQN":
-        new_model = DQN("MlpPolicy", env, verbose=1, tensorboard_log="tensorboard")
+        new_model = DQN("MlpPolicy", env, **kwargs)
     elif rl_algorithm == "RecurrentPPO":
-        new_model = RecurrentPPO("MlpLstmPolicy", env, verbose=1, tensorboard_log="tensorboard")
+        new_model = RecurrentPPO("MlpLstmPolicy", env, **kwargs)
     return new_model
 
 
 def prep_eval_model(rl_algorithm: str, model_path: str):
-    if rl_algorithm == "PPO":
+    # Policy exported with export_policy, predicted with numpy only
+    if model_path.endswith(".npz"):
+        new_model = NumpyPolicy.load(model_path)
+    elif rl_algorithm == "PPO":
         new_model = PPO.load(model_path)
     elif rl_algorithm == "A2C":
         new_model = A2C.load(model_path)
@@ -57,23 +100,24 @@ def prep_eval_model(rl_algorithm: str, model_path: str):
     return new_model
 
 
-def prep_cont_train_model(rl_algorithm: str, env: UnityToGymWrapper, model_path: Optional[str]) -> Union[PPO, A2C, DQN]:
+def prep_cont_train_model(rl_algorithm: str, env: Union[UnityToGymWrapper, VecEnv], model_path: Optional[str]) -> Union[PPO, A2C, DQN]:
+    # Loaded with the env, unlike set_env this rebuilds rollout buffers when the number of envs
+    # differs from training, e.g. fine-tuning in Unity a model pretrained on many simulated cars
     if rl_algorithm == "PPO":
-        new_model = PPO.load(model_path)
+        new_model = PPO.load(model_path, env=env)
     elif rl_algorithm == "A2C":
-        new_model = A2C.load(model_path)
+        new_model = A2C.load(model_path, env=env)
     elif rl_algorithm == "DQN":
-        new_model = DQN.load(model_path)
+        new_model = DQN.load(model_path, env=env)
     elif rl_algorithm == "RecurrentPPO":
-        new_model = RecurrentPPO.load(model_path)
-    new_model.set_env(env)
+        new_model = RecurrentPPO.load(model_path, env=env)
     return new_model
 
 
-def prep_model(rl_algorithm: str, action: str, env: UnityToGymWrapper, model_path: Optional[str]) -> Union[PPO, A2C, DQN]:
+def prep_model(rl_algorithm: str, action: str, env: Union[UnityToGymWrapper, VecEnv], model_path: Optional[str]) -> Union[PPO, A2C, DQN]:
     if action == "train":
         new_model = prep_train_model(rl_algorithm, env)
-    elif action == "eval":
+    elif action == "eval" or action == "export":
         new_model = prep_eval_model(rl_algorithm, model_path)
     elif action == "cont_train":
         new_model = prep_cont_train_model(rl_algorithm, env, model_path)
@@ -89,20 +133,48 @@ def prep_logfile_names(rl_algorithm: str) -> Tuple[str, str]:
     return filename_best, filename_checkpoint, tb_log_filename
 
 
-def prep_callbacks(env: UnityToGymWrapper, filename_best: str, filename_checkpoint: str) -> Tuple[EvalCallback, CheckpointCallback]:
-        eval_callback = EvalCallback(
-            env,
-            best_model_save_path=os.path.join("logs", filename_best),
-            log_path=os.path.join("logs", filename_best),
-            eval_freq=5000,
-            deterministic=True,
-            render=False
+def prep_eval_env_fn(env_type: str, time_scale: float, exec_filename: Optional[str], num_envs: int, obs_pipeline: Optional[str] = None, base_worker_id: int = 1, seed: int = 0) -> Tuple[Callable, str]:
+    # Evaluation worker needs its own simulator, headless and seeded like the training workers,
+    # it takes the worker id and seed after the training ones. Returns env fn and simulator name
+    if env_type == "unity" and exec_filename is not None:
+        return partial(build_unity_env, exec_filename, base_worker_id + num_envs, time_scale, seed + num_envs, obs_pipeline=obs_pipeline), "unity"
+    if env_type == "unity_multi" and exec_filename is not None:
+        return partial(prep_multi_agent_env, time_scale, exec_filename, worker_id=base_worker_id, seed=seed + 1, obs_pipeline=obs_pipeline), "unity_multi"
+    if env_type != "sim":
+        # Unity Editor can host only the training env
+        warnings.warn("Training in Unity Editor, checkpoints are evaluated and best model is chosen on the NumPy simulator")
+    return partial(prep_sim_env, 1, obs_pipeline=obs_pipeline), "sim"
+
+
+def save_obs_pipeline(obs_pipeline: Optional[str], filename_best: str, filename_checkpoint: str, log_dir: str = "logs"):
+    # Saved next to best model and checkpoints, so eval and export apply the same preprocessing
+    if not obs_pipeline:
+        return
+    pipeline = ObservationPipeline(obs_pipeline)
+    pipeline.save(os.path.join(log_dir, filename_best, PREPROCESSING_FILENAME))
+    pipeline.save(os.path.join(log_dir, filename_checkpoint + "_" + PREPROCESSING_FILENAME))
+
+
+def prep_callbacks(eval_env_fn: Callable, rl_algorithm: str, filename_best: str, filename_checkpoint: str, num_envs: int = 1, log_dir: str = "logs", save_freq: int = 2000, keep_last: Optional[int] = 5, keep_every: Optional[int] = 100_000, eval_simulator: Optional[str] = None) -> Tuple[AsyncEvalCallback, BackgroundCheckpointCallback]:
+        # Checkpoints are evaluated in a separate process, concurrently with training
+        eval_callback = AsyncEvalCallback(
+            eval_env_fn,
+            rl_algorithm,
+            checkpoint_dir=log_dir,
+            name_prefix=filename_checkpoint,
+            best_model_save_path=os.path.join(log_dir, filename_best),
+            log_path=os.path.join(log_dir, filename_best),
+            simulator=eval_simulator
         )
-        checkpoint_callback = CheckpointCallback(
-            save_freq=2000,
-            save_path="logs",
+        # Checkpoint frequency is counted in vectorized steps, each one is num_envs env steps.
+        # Checkpoints are written by a background thread, best evaluated one is never removed
+        checkpoint_callback = BackgroundCheckpointCallback(
+            save_freq=max(save_freq // num_envs, 1),
+            save_path=log_dir,
             name_prefix=filename_checkpoint,
+            keep_last=keep_last,
+            keep_every=keep_every,
+            eval_callback=eval_callback,
             verbose=2
         )
         return eval_callback, checkpoint_callback
-
@@ -1,4 +1,3 @@
-import numpy as np
 from mlagents_envs.environment import UnityEnvironment
 from stable_baselines3 import PPO
 
@@ -13,21 +12,27 @@ print(behavior_name)
 behavior_spec = env.behavior_specs[behavior_name]
 print(behavior_spec)
 
-# Information about agent that needs action or ended an episode (?)
-# [0] DecisionSteps - obs, acts, rews, agent id, action mask, this agents
+# Information about agents that need action or ended an episode
+# [0] DecisionSteps - obs, rews, agent ids and action masks of all agents that
 # need action this step (this is batch, not single agent)
-# [1] TerminalSteps - the same but for agents that end episode
-steps = env.get_steps(behavior_name)
-for step in steps:
-    print(step.obs)
+# [1] TerminalSteps - the same but for agents that ended episode, interrupted
+# flag tells whether episode hit max steps
+decision_steps, terminal_steps = env.get_steps(behavior_name)
+print("Agents: ", decision_steps.agent_id)
+for obs in decision_steps.obs:
+    print(obs.shape)
 
+episode_rewards = {}
 for i in range(100):
-    #print("Step: ", i)
-    steps = env.get_steps(behavior_name)
-    for step in steps:
-        print(np.unique(step.obs))
-    action = behavior_spec.action_spec.random_action(1)
+    decision_steps, terminal_steps = env.get_steps(behavior_name)
+    for agent_id, reward in zip(terminal_steps.agent_id, terminal_steps.reward):
+        print("Agent", agent_id, "episode reward:", episode_rewards.pop(agent_id, 0.0) + reward)
+    for agent_id, reward in zip(decision_steps.agent_id, decision_steps.reward):
+        episode_rewards[agent_id] = episode_rewards.get(agent_id, 0.0) + reward
+    # One action per agent that requested decision, sent as one batch in decision steps order.
+    # See gym-train/unity_multi_agent_env.py for vectorized env built on this
+    action = behavior_spec.action_spec.random_action(len(decision_steps))
     env.set_actions(behavior_name, action)
     env.step()
 
-env.close()
\ No newline at end of file
+env.close()